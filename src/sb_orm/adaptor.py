@@ -1,18 +1,118 @@
-from typing import List
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Any, Iterator, Iterable, Sequence
 
+from sb_db_common import Session
 from sb_serializer import Naming, HardSerializer
 
-from .database_objects import Table, Database, FieldType, KeyType
+from .database_objects import Table, Database, FieldType, KeyType, Key, Field, CycleException, TableDiff, SchemaDiff
+from .definition_reader import DefinitionLoader
 
 
 class Adaptor(object):
+    __dialect__ = ""
+    __max_parameters__ = 999
+
     def __init__(self, connection: str, naming: Naming):
         self.connection = connection
         self.naming = naming
+        self.pool = None
+
+    def new_connection(self) -> Any:
+        pass
+
+    @contextmanager
+    def connect(self) -> Iterator[Any]:
+        """ Yields a raw driver connection, borrowed from the pool when one is attached """
+        if self.pool is not None:
+            connection = self.pool.acquire()
+            try:
+                yield connection.connection
+            finally:
+                self.pool.release(connection)
+        else:
+            connection = self.new_connection()
+            try:
+                yield connection
+            finally:
+                connection.close()
 
     def import_schema(self, db_name: str) -> Database:
         pass
 
+    def get_schema_fingerprint(self, db_name: str) -> str | None:
+        """ A cheap value that changes whenever the schema does, used to key cached schema snapshots.
+            None means the dialect has no such query and the schema is always imported """
+        return None
+
+    @staticmethod
+    def _text(value: Any) -> Any:
+        if isinstance(value, (bytes, bytearray)):
+            return value.decode("utf-8")
+        return value
+
+    @staticmethod
+    def _fetch_rows(connection: Any, script: str, params: dict) -> list:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(script, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _fetch_pooled_rows(self, script: str, params: dict) -> list:
+        with self.connect() as connection:
+            return self._fetch_rows(connection, script, params)
+
+    def fetch_schema_rows(self, queries: list[tuple[str, dict]]) -> list[list]:
+        """ Runs the set based schema queries, side by side on their own connections when a pool is attached """
+        if self.pool is None:
+            with self.connect() as connection:
+                return [self._fetch_rows(connection, script, params) for script, params in queries]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = [executor.submit(self._fetch_pooled_rows, script, params) for script, params in queries]
+            return [future.result() for future in futures]
+
+    def create_schema_field(self, row: tuple) -> Field:
+        """ Builds a field from one row of the dialect's column query, less its leading table name """
+        pass
+
+    def build_schema(self, db_name: str, table_rows: list, column_rows: list, key_rows: list) -> Database:
+        """ Groups the schema wide query results into tables. Column rows lead with the table name, key rows are
+            (table, name, primary table, local columns, referenced columns, non unique, type) """
+        database = Database(self.naming.string_to_name(db_name))
+        tables: dict[str, Table] = {}
+        for row in table_rows:
+            name = self._text(row[0])
+            table = Table(self.naming.string_to_name(name))
+            tables[name] = table
+            database.tables.append(table)
+
+        for row in column_rows:
+            table = tables.get(self._text(row[0]))
+            if table is not None:
+                table.fields.append(self.create_schema_field(tuple(row[1:])))
+
+        for row in key_rows:
+            table = tables.get(self._text(row[0]))
+            if table is None:
+                continue
+            key = Key(self.naming.string_to_name(self._text(row[1])))
+            key.referenced_table = table.name.raw()
+            key.key_type = KeyType.get_keytype(self._text(row[6]))
+            key.fields = [f.strip() for f in self._text(row[3]).split(",")]
+            if key.key_type == KeyType.ForeignKey:
+                key.primary_table = self._text(row[2])
+                key.primary_fields = [f.strip() for f in self._text(row[4]).split(",")]
+
+            if key.key_type == KeyType.PrimaryKey:
+                table.pk = key
+            else:
+                table.keys.append(key)
+
+        return database
+
     @staticmethod
     def generate_schema_definition(database: Database, definition_file: str, serializer:HardSerializer):
         with open(definition_file, 'w') as output_file:
@@ -20,16 +120,12 @@ class Adaptor(object):
             output_file.flush()
 
     @staticmethod
-    def import_definition(definition_file: str, naming: Naming, serializer:HardSerializer) -> Database:
-        text = ""
+    def import_definition(definition_file: str, naming: Naming, serializer: HardSerializer | None = None,
+                          lazy: bool = False) -> Database:
+        """ Streams the definition file a table at a time. With lazy, each table is kept as its source and only
+            mapped on first use. serializer is no longer needed and is kept for existing callers """
         with open(definition_file, 'r') as input_file:
-            lines = input_file.readlines()
-            for line in lines:
-                text = text + line
-
-        database = serializer.de_serialize(text, naming)
-        Adaptor._process_foreign_keys(database)
-        return database
+            return DefinitionLoader(naming).load(input_file, lazy)
 
     @staticmethod
     def _process_foreign_keys(database: Database):
@@ -39,22 +135,115 @@ class Adaptor(object):
                 primary_table.foreign_keys.append(foreign_key)
 
     @staticmethod
-    def _add_dependant_tables(database: Database, table: Table, table_list: List[Table]):
-        if table not in table_list:
-            for fk in [key for key in table.keys if key.key_type == KeyType.ForeignKey]:
-                primary_table = database.get_table(fk.primary_table)
-                Adaptor._add_dependant_tables(database, primary_table, table_list)
-            if table not in table_list:
-                table_list.append(table)
+    def _get_primary_tables(database: Database, tables: List[Table]) -> List[List[int]]:
+        """ For each table, the positions of the tables its foreign keys point at. Self references and tables
+            outside the database are left out """
+        positions = {id(table): i for i, table in enumerate(tables)}
+        primary_tables = []
+        for table in tables:
+            found = []
+            for key in table.keys:
+                if key.key_type == KeyType.ForeignKey:
+                    primary_table = database.get_table(key.primary_table)
+                    if primary_table is not None and primary_table is not table and id(primary_table) in positions:
+                        position = positions[id(primary_table)]
+                        if position not in found:
+                            found.append(position)
+            primary_tables.append(found)
+        return primary_tables
+
+    @staticmethod
+    def get_table_levels(database: Database) -> List[List[Table]]:
+        """ Groups the tables into levels whose foreign keys only point at earlier levels, so the tables within a
+            level can be created or loaded concurrently. Tables keep their database order within a level.
+            Raises CycleException when the foreign keys form a cycle """
+        tables = list(database.tables)
+        primary_tables = Adaptor._get_primary_tables(database, tables)
+        dependants: dict[int, List[int]] = {}
+        pending = [len(found) for found in primary_tables]
+        for i, found in enumerate(primary_tables):
+            for position in found:
+                dependants.setdefault(position, []).append(i)
+
+        levels: List[List[Table]] = []
+        level = [i for i, count in enumerate(pending) if count == 0]
+        while len(level) > 0:
+            levels.append([tables[i] for i in level])
+            next_level = []
+            for i in level:
+                for dependant in dependants.get(i, []):
+                    pending[dependant] -= 1
+                    if pending[dependant] == 0:
+                        next_level.append(dependant)
+            level = sorted(next_level)
+
+        if sum([len(level) for level in levels]) < len(tables):
+            # every table left over waits on another left over table, so following them must come back round
+            position = next(i for i, count in enumerate(pending) if count > 0)
+            path: List[int] = []
+            seen: dict[int, int] = {}
+            while position not in seen:
+                seen[position] = len(path)
+                path.append(position)
+                position = next(p for p in primary_tables[position] if pending[p] > 0)
+            cycle = path[seen[position]:] + [position]
+            raise CycleException([tables[i].name.raw() for i in cycle])
+        return levels
 
     @staticmethod
     def get_ordered_table_list(database: Database) -> List[Table]:
-        # find references and push in front
-        tables: List[Table] = []
-        for table in database.tables:
-            Adaptor._add_dependant_tables(database, table, tables)
+        """ The tables ordered so that every table comes after the tables its foreign keys reference """
+        return [table for level in Adaptor.get_table_levels(database) for table in level]
+
+    def fetch_one_prepared(self, session: Session, script: str, params: dict) -> Any:
+        """ Runs a generated script as a statement prepared once per connection. Dialects without server-side
+            prepare (sqlite keeps its own statement cache) fall back to a plain execute """
+        return session.fetch_one(script, params)
+
+    def execute_prepared(self, session: Session, script: str, params: dict) -> None:
+        session.execute(script, params)
+
+    def execute_lastrowid_prepared(self, session: Session, script: str, params: dict) -> Any:
+        return session.execute_lastrowid(script, params)
+
+    def bulk_load(self, session: Session, table: Table, rows: Iterable[Sequence], batch_size: int,
+                  commit: bool = False) -> int:
+        """ Loads rows holding the table's non auto increment fields in definition order, returns the row count.
+            Dialects override this with their native bulk path, this fallback uses multi-row inserts.
+            With commit the load is committed with the session, which the caller must have committed beforehand;
+            a dialect may then load outside the caller's transaction """
+        names = [f.name.raw() for f in table.fields if not f.auto_increment]
+        batch_size = self.get_insert_batch_size(table, batch_size)
+        iterator = iter(rows)
+        count = 0
+        while True:
+            batch = [dict(zip(names, row)) for row in itertools.islice(iterator, batch_size)]
+            if len(batch) == 0:
+                break
+            self.execute_insert_many(session, table, batch)
+            count += len(batch)
+        if commit:
+            session.commit()
+        return count
+
+    def generate_reset_identity_scripts(self, table: Table) -> List[str]:
+        """ Moves the table's identity generators past the rows loaded with explicit ids. Dialects whose auto
+            increment follows the data need nothing """
+        return []
+
+    def execute_many(self, session: Session, script: str, params: List[dict]) -> None:
+        cursor = session.connection.new_cursor()
+        try:
+            cursor.executemany(script, params)
+        finally:
+            cursor.close()
+
+    def new_stream_cursor(self, session: Session, chunk_size: int) -> Any:
+        return session.connection.new_cursor()
 
-        return tables
+    def close_stream_cursor(self, session: Session, cursor: Any) -> None:
+        """ Closes a cursor from new_stream_cursor, whether or not its rows were all read """
+        cursor.close()
 
     def escape_field_list(self, values: List[str]) -> List[str]:
         pass
@@ -63,8 +252,70 @@ class Adaptor(object):
         pass
 
     def generate_create_script(self, table: Table) -> str:
+        return self.generate_create_table_script(table) + "".join(self.generate_create_index_scripts(table))
+
+    def generate_create_table_script(self, table: Table) -> str:
+        """ The create table statement alone, with the primary and foreign keys but none of the indexes """
+        pass
+
+    def generate_create_index_script(self, table: Table, key: Key) -> str:
+        pass
+
+    def generate_create_index_scripts(self, table: Table) -> List[str]:
+        return [self.generate_create_index_script(table, key) for key in table.keys
+                if key.key_type in (KeyType.Unique, KeyType.Index)]
+
+    def generate_field_definition(self, field: Field) -> str:
+        """ The column as it appears in the create table statement """
+        pass
+
+    def generate_drop_index_script(self, table: Table, key: Key) -> str:
         pass
 
+    def generate_add_foreign_key_scripts(self, table: Table, key: Key) -> List[str]:
+        pass
+
+    def generate_drop_foreign_key_scripts(self, table: Table, key: Key) -> List[str]:
+        pass
+
+    def generate_alter_table_scripts(self, diff: TableDiff) -> List[str]:
+        """ The column and primary key changes of a table, as few statements as the dialect allows so the table is
+            rewritten at most once. Indexes and foreign keys are left to generate_migration_scripts """
+        pass
+
+    def generate_migration_scripts(self, diff: SchemaDiff) -> List[str]:
+        """ Orders the changes so nothing is dropped while still referenced and nothing is created before what it
+            references: foreign keys and indexes are dropped first, then tables are altered, dropped and created,
+            and indexes and foreign keys are added last, once their columns and tables exist """
+        added = set([id(table) for table in diff.added_tables])
+        dropped = set([id(table) for table in diff.dropped_tables])
+        scripts: List[str] = []
+        for table_diff in diff.altered_tables:
+            for key in [key for key in table_diff.dropped_keys if key.key_type == KeyType.ForeignKey]:
+                scripts += self.generate_drop_foreign_key_scripts(table_diff.old_table, key)
+        for table_diff in diff.altered_tables:
+            scripts += [self.generate_drop_index_script(table_diff.old_table, key) for key in table_diff.dropped_keys
+                        if key.key_type in (KeyType.Unique, KeyType.Index)]
+        for table_diff in diff.altered_tables:
+            scripts += self.generate_alter_table_scripts(table_diff)
+
+        if len(dropped) > 0:
+            for level in reversed(self.get_table_levels(diff.source)):
+                scripts += [self.generate_drop_script(table) for table in level if id(table) in dropped]
+        if len(added) > 0:
+            for level in self.get_table_levels(diff.target):
+                scripts += [self.generate_create_table_script(table) for table in level if id(table) in added]
+
+        for table in diff.added_tables:
+            scripts += self.generate_create_index_scripts(table)
+        for table_diff in diff.altered_tables:
+            scripts += [self.generate_create_index_script(table_diff.new_table, key) for key in table_diff.added_keys
+                        if key.key_type in (KeyType.Unique, KeyType.Index)]
+        for table_diff in diff.altered_tables:
+            for key in [key for key in table_diff.added_keys if key.key_type == KeyType.ForeignKey]:
+                scripts += self.generate_add_foreign_key_scripts(table_diff.new_table, key)
+        return scripts
+
     def generate_table_exists_script(self, table: Table, db_name: str) -> str:
         pass
 
@@ -74,9 +325,27 @@ class Adaptor(object):
     def generate_insert_script(self, table: Table) -> str:
         pass
 
+    def generate_insert_many_script(self, table: Table, row_count: int) -> str:
+        pass
+
+    def execute_insert_many(self, session: Session, table: Table, params: List[dict]) -> List[Any]:
+        pass
+
+    @staticmethod
+    def get_insert_many_params(params: List[dict]) -> dict:
+        return {f"{key}_{index}": value for index, row in enumerate(params) for key, value in row.items()}
+
+    def get_insert_batch_size(self, table: Table, batch_size: int) -> int:
+        # multi-row inserts bind every column of every row, so keep under the driver parameter limit
+        field_count = max(len([f for f in table.fields if not f.auto_increment]), 1)
+        return max(min(batch_size, self.__max_parameters__ // field_count), 1)
+
     def generate_update_script(self, table: Table) -> str:
         pass
 
+    def generate_partial_update_script(self, table: Table, fields: List[str]) -> str:
+        pass
+
     def generate_delete_script(self, table: Table) -> str:
         pass
 
@@ -86,6 +355,19 @@ class Adaptor(object):
     def generate_item_exists_script(self, table: Table) -> str:
         pass
 
+    def generate_fetch_by_ids_script(self, table: Table, id_count: int) -> str:
+        pass
+
+    def generate_keyset_script(self, table: Table, fields: List[str], descending: bool, has_after: bool) -> str:
+        """ Seek query over fields, continuing after the :after_<field> values when has_after is set """
+        pass
+
+    def get_fetch_by_ids_params(self, table: Table, ids: List[dict]) -> dict:
+        return {f"{field}_{index}": id[field] for index, id in enumerate(ids) for field in table.pk.fields}
+
+    def get_fetch_by_ids_batch_size(self, table: Table, batch_size: int) -> int:
+        return max(min(batch_size, self.__max_parameters__ // max(len(table.pk.fields), 1)), 1)
+
     def get_field_type(self, field_type: FieldType) -> str:
         pass
 
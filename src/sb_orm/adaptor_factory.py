@@ -1,27 +1,60 @@
 import re
+import threading
 
 from sb_serializer import Naming
 
 from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.connection_pool import ConnectionPool
 from src.sb_orm.mysql_adaptor import MySqlAdaptor
 from src.sb_orm.pgsql_adaptor import PgSqlAdaptor
 from src.sb_orm.sqlite_adaptor import SqliteAdaptor
 
 
 class AdaptorFactory(object):
+    pools: dict[str, ConnectionPool] = {}
+    _pool_lock = threading.Lock()
+
     @classmethod
-    def get_adaptor_for_connection_string(cls, connection_string: str, naming: Naming) -> Adaptor:
+    def get_adaptor_for_connection_string(cls, connection_string: str, naming: Naming,
+                                          pooled: bool = False) -> Adaptor:
         match = re.search(r"(\w+):\/\/(.+)", connection_string)
         if match:
             db_type = match.group(1)
             connection = match.group(2)
 
             if db_type == "sqlite":
-                return SqliteAdaptor(connection_string, naming)
+                adaptor = SqliteAdaptor(connection_string, naming)
             elif db_type == "mysql":
-                return MySqlAdaptor(connection_string, naming)
+                adaptor = MySqlAdaptor(connection_string, naming)
             elif db_type == "pgsql":
-                return PgSqlAdaptor(connection_string, naming)
+                adaptor = PgSqlAdaptor(connection_string, naming)
+            else:
+                return None
+
+            if pooled:
+                adaptor.pool = cls.get_pool_for_connection_string(connection_string)
+            return adaptor
+
+    @classmethod
+    def get_pool_for_connection_string(cls, connection_string: str, min_size: int = 1, max_size: int = 10,
+                                       idle_timeout: float = 300.0, health_check: bool = True,
+                                       thread_affinity: bool | None = None) -> ConnectionPool:
+        """ One shared pool per connection string, the sizing arguments only apply when it is first created """
+        with cls._pool_lock:
+            pool = cls.pools.get(connection_string)
+            if pool is None:
+                pool = ConnectionPool(connection_string, min_size=min_size, max_size=max_size,
+                                      idle_timeout=idle_timeout, health_check=health_check,
+                                      thread_affinity=thread_affinity)
+                cls.pools[connection_string] = pool
+            return pool
+
+    @classmethod
+    def close_pools(cls):
+        with cls._pool_lock:
+            for pool in cls.pools.values():
+                pool.close()
+            cls.pools.clear()
 
     @classmethod
     def get_adaptor_for_dbtype(cls, dbtype: str, naming: Naming) -> Adaptor:
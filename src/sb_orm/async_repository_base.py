@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import itertools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from sb_db_common import Session
+
+from src.sb_orm import TableBase
+from src.sb_orm.repository_base import RepositoryBase
+
+
+class AsyncRepositoryBase:
+    """ Awaitable wrapper over a RepositoryBase subclass.
+        Calls run on a bounded thread pool per async repository class, so the blocking drivers never stall
+        the event loop. A session must only be used by one call at a time. """
+    __repository__: type
+    __max_workers__ = 32
+    __executors__: dict[type, Executor] = {}
+    __executor_lock__ = threading.Lock()
+
+    def __init__(self, executor: Executor | None = None):
+        self.repository: RepositoryBase = self.__repository__()
+        self.executor = executor
+
+    @property
+    def __table__(self) -> type:
+        return self.repository.__table__
+
+    @classmethod
+    def _get_shared_executor(cls) -> Executor:
+        # one per class, so each runs with its own __max_workers__
+        with AsyncRepositoryBase.__executor_lock__:
+            executor = AsyncRepositoryBase.__executors__.get(cls)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=cls.__max_workers__,
+                                              thread_name_prefix=f"sb_orm_async_{cls.__name__}")
+                AsyncRepositoryBase.__executors__[cls] = executor
+            return executor
+
+    async def _run(self, func: Callable, *args) -> Any:
+        executor = self.executor if self.executor is not None else self._get_shared_executor()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    async def fetch_by_id(self, session: Session, id: None | dict) -> TableBase | None:
+        return await self._run(self.repository.fetch_by_id, session, id)
+
+    async def fetch_by_ids(self, session: Session, ids: list[dict], batch_size: int = 1000) -> list[TableBase | None]:
+        return await self._run(self.repository.fetch_by_ids, session, ids, batch_size)
+
+    async def fetch_one(self, session: Session, query: str, parameters: None | dict = None) -> TableBase | None:
+        return await self._run(self.repository.fetch_one, session, query, parameters)
+
+    @staticmethod
+    def _next_chunk(iterator: Iterator[TableBase], chunk_size: int) -> list[TableBase]:
+        return list(itertools.islice(iterator, chunk_size))
+
+    async def fetch_multiple(self, session: Session, query: str, parameters: None | dict = None,
+                             chunk_size: int = 1000) -> AsyncIterator[TableBase]:
+        iterator = self.repository.iter_multiple(session, query, parameters, chunk_size)
+        try:
+            while True:
+                items = await self._run(self._next_chunk, iterator, chunk_size)
+                if len(items) == 0:
+                    break
+                for item in items:
+                    yield item
+        finally:
+            await self._run(iterator.close)
+
+    async def execute_query(self, session: Session, name: str, parameters: None | dict = None) -> Any:
+        return await self._run(self.repository.execute_query, session, name, parameters)
+
+    async def paginate(self, session: Session, after: str | None = None, limit: int = 100,
+                       order_by: str | None = None, descending: bool = False) -> tuple[list[TableBase], str | None]:
+        return await self._run(self.repository.paginate, session, after, limit, order_by, descending)
+
+    async def count_all(self, session: Session):
+        return await self._run(self.repository.count_all, session)
+
+    async def add(self, session: Session, item: TableBase):
+        return await self._run(self.repository.add, session, item)
+
+    async def add_many(self, session: Session, items: list[TableBase], batch_size: int = 500) -> list[Any]:
+        return await self._run(self.repository.add_many, session, items, batch_size)
+
+    async def update(self, session: Session, item: TableBase):
+        return await self._run(self.repository.update, session, item)
+
+    async def _delete_row(self, session: Session, id: None | dict):
+        return await self._run(self.repository._delete_row, session, id)
+
+    async def _item_exists(self, session: Session, id: None | dict):
+        return await self._run(self.repository._item_exists, session, id)
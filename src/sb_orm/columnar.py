@@ -0,0 +1,70 @@
+from array import array
+from typing import Any
+
+from src.sb_orm.database_objects import Field, FieldType
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def get_numpy_dtype(field: Field | None) -> str:
+    if field is None:
+        return "object"
+    if field.type == FieldType.Integer:
+        if field.size == 1:
+            return "int8"
+        elif field.size == 2:
+            return "int16"
+        elif field.size == 3 or field.size == 4:
+            return "int32"
+        return "int64"
+    elif field.type == FieldType.Float:
+        return "float32" if field.size == 4 else "float64"
+    elif field.type == FieldType.Boolean:
+        return "bool"
+    return "object"
+
+
+def get_array_typecode(field: Field | None) -> str | None:
+    """ array.array typecode for the field, None where values have to stay in a list """
+    if field is None:
+        return None
+    if field.type == FieldType.Integer:
+        if field.size == 1:
+            return "b"
+        elif field.size == 2:
+            return "h"
+        elif field.size == 3 or field.size == 4:
+            return "i"
+        return "q"
+    elif field.type == FieldType.Float:
+        return "f" if field.size == 4 else "d"
+    elif field.type == FieldType.Boolean:
+        return "B"
+    return None
+
+
+def to_column(values: list, field: Field | None) -> Any:
+    """ Packs one column of values. Nulls (except as nan in floats) or out of range values in a typed column
+        fall back to objects """
+    if numpy is not None:
+        dtype = get_numpy_dtype(field)
+        # floats take nulls as nan, every other typed column would coerce them silently
+        if dtype != "object" and (dtype.startswith("float") or None not in values):
+            try:
+                return numpy.array(values, dtype=dtype)
+            except (TypeError, ValueError, OverflowError):
+                pass
+        column = numpy.empty(len(values), dtype="object")
+        column[:] = values
+        return column
+
+    typecode = get_array_typecode(field)
+    if typecode is not None:
+        try:
+            return array(typecode, values)
+        except (TypeError, OverflowError):
+            pass
+    return values
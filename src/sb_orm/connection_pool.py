@@ -0,0 +1,192 @@
+import threading
+import time
+
+from sb_db_common import ConnectionBase, Session, SessionFactory, DataException
+
+
+class PooledSession(Session):
+    """ Session over a pooled connection. Closing commits and hands the connection back instead of closing it.
+        checkout_wait is the time spent waiting for the connection, reported with the session's first statement """
+
+    def __init__(self, pool: "ConnectionPool", connection: ConnectionBase, checkout_wait: float = 0.0):
+        super().__init__(connection)
+        self.pool = pool
+        self.checkout_wait = checkout_wait
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.commit()
+        finally:
+            self.pool.release(self.connection)
+            self.connection = None
+
+
+class ConnectionPool(object):
+    """ Pool of sb_db_common connections for one connection string.
+        Connections idle for longer than idle_timeout are closed down to min_size, and each connection is
+        pinged on checkout when health_check is set. With thread_affinity (the default for sqlite) a thread
+        gets back the connection it last released where possible. """
+    __health_check_script__ = "select 1"
+
+    def __init__(self, connection_string: str, min_size: int = 1, max_size: int = 10, idle_timeout: float = 300.0,
+                 checkout_timeout: float = 30.0, health_check: bool = True, thread_affinity: bool | None = None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise DataException("Invalid pool size")
+
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check = health_check
+        self.thread_affinity = connection_string.startswith("sqlite") if thread_affinity is None \
+            else thread_affinity
+
+        # idle entries are (connection, released at, releasing thread id)
+        self._idle: list[tuple[ConnectionBase, float, int]] = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic(), threading.get_ident()))
+            self._size += 1
+
+    def _new_connection(self) -> ConnectionBase:
+        connection = SessionFactory.get_connection(self.connection_string)
+        if connection is None:
+            raise DataException("invalid connection string")
+        return connection
+
+    def _is_alive(self, connection: ConnectionBase) -> bool:
+        try:
+            cursor = connection.new_cursor()
+            cursor.execute(self.__health_check_script__)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection: ConnectionBase) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _prune_idle(self) -> list[ConnectionBase]:
+        # called with the lock held, returns the connections to close once it is released
+        if self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        expired = []
+        for entry in list(self._idle):
+            if self._size - len(expired) <= self.min_size:
+                break
+            if now - entry[1] > self.idle_timeout:
+                self._idle.remove(entry)
+                expired.append(entry[0])
+        self._size -= len(expired)
+        return expired
+
+    def _take_idle(self) -> ConnectionBase:
+        index = len(self._idle) - 1
+        if self.thread_affinity:
+            thread_id = threading.get_ident()
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][2] == thread_id:
+                    index = i
+                    break
+        return self._idle.pop(index)[0]
+
+    def acquire(self, timeout: float | None = None) -> ConnectionBase:
+        if timeout is None:
+            timeout = self.checkout_timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            connection = None
+            with self._condition:
+                if self._closed:
+                    raise DataException("Connection pool is closed")
+                expired = self._prune_idle()
+                while len(self._idle) == 0 and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        raise DataException("Timed out waiting for a pooled connection")
+                if len(self._idle) > 0:
+                    connection = self._take_idle()
+                else:
+                    self._size += 1
+
+            for expired_connection in expired:
+                self._discard(expired_connection)
+
+            if connection is None:
+                try:
+                    return self._new_connection()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+
+            if not self.health_check or self._is_alive(connection):
+                return connection
+
+            # dead connection, drop it and try again
+            self._discard(connection)
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+
+    def release(self, connection: ConnectionBase) -> None:
+        try:
+            # leave no transaction open on an idle connection
+            connection.connection.rollback()
+        except Exception:
+            self._discard(connection)
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            return
+
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                self._discard(connection)
+                return
+            self._idle.append((connection, time.monotonic(), threading.get_ident()))
+            self._condition.notify()
+
+    def session(self) -> PooledSession:
+        start = time.monotonic()
+        connection = self.acquire()
+        return PooledSession(self, connection, time.monotonic() - start)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            self._discard(connection)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
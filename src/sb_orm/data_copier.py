@@ -0,0 +1,224 @@
+import copy
+import datetime
+import decimal
+import json
+import os
+import queue
+import tempfile
+import threading
+from typing import Any, Callable, List, Sequence
+
+from sb_db_common import Session
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import Database, Table, FieldType, DataException
+from src.sb_orm.instrumentation import logger
+
+
+def get_stored_type(adaptor: Adaptor, field_type: FieldType) -> FieldType:
+    """ The type the adaptor keeps a field of field_type as, from its must_remap_field. The type is taken even
+        when no remap is flagged, sqlite keeps decimals as floats without asking for one """
+    return adaptor.must_remap_field(field_type)[1]
+
+
+def read_value(value: Any, field_type: FieldType) -> Any:
+    """ A value as stored back to the field's own type """
+    if field_type == FieldType.Datetime:
+        if isinstance(value, (int, float)):
+            return datetime.datetime.fromtimestamp(value)
+        if isinstance(value, str):
+            # sqlite's default adapter writes datetimes as iso text whatever the column type
+            return datetime.datetime.fromisoformat(value)
+    elif field_type == FieldType.Boolean:
+        return bool(value)
+    elif field_type == FieldType.Decimal and isinstance(value, float):
+        return decimal.Decimal(str(value))
+    return value
+
+
+def write_value(value: Any, field_type: FieldType, stored_type: FieldType) -> Any:
+    """ A value of the field's own type as it is to be stored """
+    if stored_type == FieldType.Float:
+        if isinstance(value, datetime.datetime):
+            return value.timestamp()
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+    elif stored_type == FieldType.Integer and field_type == FieldType.Boolean:
+        return int(value)
+    return value
+
+
+def get_converter(field_type: FieldType, source_type: FieldType,
+                  target_type: FieldType) -> Callable[[Any], Any] | None:
+    """ None when both sides store the field the same way """
+    if source_type == target_type:
+        return None
+    return lambda value: None if value is None else write_value(read_value(value, field_type), field_type,
+                                                                target_type)
+
+
+class DataCopier(object):
+    """ Copies the rows of every table in a Database from one adaptor's database to another's, in foreign key
+        order. Each table is read by a producer thread into a bounded queue of batches, so reading the source
+        overlaps writing the target without ever holding more than queue_size batches. Batches are written with
+        the target's bulk_load and committed one at a time.
+
+        With checkpoint_file, the tables finished and the rows copied are recorded after every batch. A rerun skips
+        the finished tables and picks up the table in progress from what the target holds: after its last primary
+        key, or past as many rows as it has for a table without one. Tables are read in primary key order, or
+        ordered by every column without one, so the source must not change between runs """
+
+    def __init__(self, source: Adaptor, target: Adaptor, database: Database, batch_size: int = 10000,
+                 queue_size: int = 4, checkpoint_file: str | None = None):
+        if batch_size < 1 or queue_size < 1:
+            raise DataException("Invalid batch or queue size")
+        self.source = source
+        self.target = target
+        self.database = database
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.checkpoint_file = checkpoint_file
+        # table name -> {"rows": rows copied, "done": finished}
+        self.checkpoint: dict[str, dict] = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> dict[str, dict]:
+        if self.checkpoint_file is None or not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file, "r") as input_file:
+            return json.load(input_file)
+
+    def _save_checkpoint(self) -> None:
+        if self.checkpoint_file is None:
+            return
+        # written aside and renamed, so a crash leaves the previous checkpoint whole
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_file))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as output_file:
+                json.dump(self.checkpoint, output_file)
+            os.replace(temp_path, self.checkpoint_file)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _get_converters(self, table: Table, from_adaptor: Adaptor,
+                        to_adaptor: Adaptor) -> List[Callable[[Any], Any] | None]:
+        return [get_converter(f.type, get_stored_type(from_adaptor, f.type), get_stored_type(to_adaptor, f.type))
+                for f in table.fields]
+
+    @staticmethod
+    def _convert(rows: List[Sequence], converters: List[Callable[[Any], Any] | None]) -> List[Sequence]:
+        if all([converter is None for converter in converters]):
+            return rows
+        return [tuple([value if converter is None else converter(value) for value, converter in zip(row, converters)])
+                for row in rows]
+
+    @staticmethod
+    def _get_order_fields(table: Table) -> List[str]:
+        if table.pk is not None and len(table.pk.fields) > 0:
+            return list(table.pk.fields)
+        return [f.name.raw() for f in table.fields]
+
+    def _get_resume_point(self, target_session: Session, table: Table) -> tuple[dict, int]:
+        """ The keyset parameters and the number of rows to skip that continue the table from the target's rows """
+        if table.pk is None or len(table.pk.fields) == 0:
+            return {}, target_session.fetch_scalar(self.target.generate_count_script(table)) or 0
+
+        fields = self._get_order_fields(table)
+        script = self.target.generate_keyset_script(table, fields, True, False)
+        row = target_session.fetch_one(script, {"limit": 1})
+        if row is None:
+            return {}, 0
+        converters = self._get_converters(table, self.target, self.source)
+        row = self._convert([row], converters)[0]
+        indexes = [table.fields.index(table.find_field(f)) for f in fields]
+        return {f"after_{f}": row[i] for f, i in zip(fields, indexes)}, 0
+
+    def _produce(self, source_session: Session, table: Table, after: dict, skip: int, batches: queue.Queue,
+                 stopped: threading.Event) -> None:
+        def put(item: Any) -> bool:
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            count = source_session.fetch_scalar(self.source.generate_count_script(table)) or 0
+            if count > skip:
+                script = self.source.generate_keyset_script(table, self._get_order_fields(table), False,
+                                                             len(after) > 0)
+                converters = self._get_converters(table, self.source, self.target)
+                cursor = self.source.new_stream_cursor(source_session, self.batch_size)
+                try:
+                    # the count bounds the limit every keyset script carries
+                    cursor.execute(script, dict(after, limit=count))
+                    while skip > 0:
+                        skipped = len(cursor.fetchmany(min(skip, self.batch_size)))
+                        skip = 0 if skipped == 0 else skip - skipped
+                    while True:
+                        rows = cursor.fetchmany(self.batch_size)
+                        if not rows or not put(self._convert(rows, converters)):
+                            break
+                finally:
+                    # a stopped copy leaves rows unread on the source
+                    self.source.close_stream_cursor(source_session, cursor)
+            put(None)
+        except BaseException as ex:
+            put(ex)
+
+    def copy_table(self, source_session: Session, target_session: Session, table: Table) -> int:
+        """ Copies one table, returns the rows copied by this call """
+        name = table.name.raw()
+        state = self.checkpoint.get(name)
+        if state is not None and state["done"]:
+            return 0
+
+        after, skip = ({}, 0) if state is None else self._get_resume_point(target_session, table)
+        state = {"rows": 0 if state is None else state["rows"], "done": False}
+        self.checkpoint[name] = state
+        # ids are copied as they are, so auto increment fields are loaded like any other
+        load_table = Table(table.name, [copy.copy(f) for f in table.fields], table.pk, table.keys)
+        for field in load_table.fields:
+            field.auto_increment = False
+
+        batches: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stopped = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(source_session, table, after, skip, batches, stopped),
+                                    name=f"copy-{name}", daemon=True)
+        producer.start()
+        copied = 0
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                self.target.bulk_load(target_session, load_table, batch, self.batch_size)
+                target_session.commit()
+                copied += len(batch)
+                state["rows"] += len(batch)
+                self._save_checkpoint()
+        except BaseException:
+            # the batches committed so far stay, the checkpoint carries on from them
+            target_session.rollback()
+            raise
+        finally:
+            stopped.set()
+            producer.join()
+
+        for script in self.target.generate_reset_identity_scripts(table):
+            target_session.execute(script)
+        target_session.commit()
+        state["done"] = True
+        self._save_checkpoint()
+        logger.info("Copied %d rows into %s", copied, name)
+        return copied
+
+    def copy(self, source_session: Session, target_session: Session) -> dict[str, int]:
+        """ Copies every table, primary tables first. Returns the rows copied per table by this call """
+        return {table.name.raw(): self.copy_table(source_session, target_session, table)
+                for table in Adaptor.get_ordered_table_list(self.database)}
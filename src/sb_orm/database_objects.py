@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any, Union, List
+from typing import Any, Union, List, Callable, Iterable
 
 from sb_serializer import Name
 
@@ -12,6 +12,93 @@ class DatatypeException(DataException):
     pass
 
 
+class CycleException(DataException):
+    """ Foreign keys that form a cycle. tables holds the cycle's table names, each referencing the next, with the
+        first repeated at the end """
+
+    def __init__(self, tables: list[str]):
+        super().__init__(f"Foreign key cycle: {' -> '.join(tables)}")
+        self.tables = tables
+
+
+def get_raw_name(item: Any) -> str | None:
+    return None if item.name is None else item.name.raw()
+
+
+def get_lower_name(item: Any) -> str | None:
+    return None if item.name is None else item.name.raw().lower()
+
+
+class NamedList(list):
+    """ A list of named objects with an index from name to the first object of that name, kept up to date by
+        every list mutation. Renaming an object already in the list needs reindex() """
+
+    def __init__(self, items: Iterable = (), key: Callable[[Any], str | None] = get_raw_name):
+        super().__init__(items)
+        self.key = key
+        self.by_name: dict[str | None, Any] = {}
+        self.reindex()
+
+    def __reduce__(self):
+        return self.__class__, (list(self), self.key)
+
+    def reindex(self) -> None:
+        self.by_name = {}
+        for item in self:
+            self.by_name.setdefault(self.key(item), item)
+
+    def find(self, name: str) -> Any | None:
+        return self.by_name.get(name)
+
+    def append(self, item: Any) -> None:
+        super().append(item)
+        self.by_name.setdefault(self.key(item), item)
+
+    def extend(self, items: Iterable) -> None:
+        items = list(items)
+        super().extend(items)
+        for item in items:
+            self.by_name.setdefault(self.key(item), item)
+
+    def __iadd__(self, items: Iterable):
+        self.extend(items)
+        return self
+
+    # anything that can change which object comes first for a name rebuilds the index
+    def insert(self, position: int, item: Any) -> None:
+        super().insert(position, item)
+        self.reindex()
+
+    def remove(self, item: Any) -> None:
+        super().remove(item)
+        self.reindex()
+
+    def pop(self, position: int = -1) -> Any:
+        item = super().pop(position)
+        self.reindex()
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self.by_name = {}
+
+    def __setitem__(self, position, value) -> None:
+        super().__setitem__(position, value)
+        self.reindex()
+
+    def __delitem__(self, position) -> None:
+        super().__delitem__(position)
+        self.reindex()
+
+    def sort(self, *args, **kwargs) -> None:
+        super().sort(*args, **kwargs)
+        self.reindex()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self.reindex()
+
+
 class FieldType:
     pass
 
@@ -153,11 +240,12 @@ class Key(object):
     referenced_table: str
     key_type: KeyType
 
-    def __init__(self, name: Name = None, key_type: KeyType = KeyType.Undefined, fields:list[str]= [], primary_table: str = "", primary_fields:list[str]=[]):
+    def __init__(self, name: Name = None, key_type: KeyType = KeyType.Undefined, fields: list[str] | None = None,
+                 primary_table: str = "", primary_fields: list[str] | None = None):
         self.name = name
-        self.fields: List[str] = fields
+        self.fields: List[str] = fields if fields is not None else []
         self.primary_table = primary_table
-        self.primary_fields: List[str] = primary_fields
+        self.primary_fields: List[str] = primary_fields if primary_fields is not None else []
         self.key_type = key_type
         self.referenced_table = ""
 
@@ -253,21 +341,41 @@ class Table(object):
     foreign_keys: list[Key]
     custom_queries: list[CustomQuery]
 
-    def __init__(self, name: Name = None, fields: list[Field] = [], pk: Key = None, keys: list[Key] = [],
-                 foreign_keys: list[Key] = [], custom_queries: list[CustomQuery] = []):
+    def __init__(self, name: Name = None, fields: list[Field] | None = None, pk: Key = None,
+                 keys: list[Key] | None = None, foreign_keys: list[Key] | None = None,
+                 custom_queries: list[CustomQuery] | None = None):
         self.name = name
-        self.fields: list[Field] = fields
+        self.fields = fields if fields is not None else []
         self.pk: Key | None = pk
-        self.keys: list[Key] = keys
-        self.foreign_keys: list[Key] = foreign_keys
-        self.custom_queries: list[CustomQuery] = custom_queries
+        self.keys = keys if keys is not None else []
+        self.foreign_keys: list[Key] = foreign_keys if foreign_keys is not None else []
+        self.custom_queries: list[CustomQuery] = custom_queries if custom_queries is not None else []
+
+    # fields and keys are kept as NamedLists whatever list is assigned, so lookups by name are O(1)
+    @property
+    def fields(self) -> list[Field]:
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields: list[Field]) -> None:
+        self._fields = NamedList(fields, get_lower_name)
+
+    @property
+    def keys(self) -> list[Key]:
+        return self._keys
+
+    @keys.setter
+    def keys(self, keys: list[Key]) -> None:
+        self._keys = NamedList(keys)
 
     def find_field(self, name: str) -> Field:
-        found_fields = [f for f in self.fields if f.name.raw().lower() == name.lower()]
-        if len(found_fields) > 0:
-            return found_fields[0]
-        else:
+        field = self._fields.find(name.lower())
+        if field is None:
             raise DataException("Could not find field")
+        return field
+
+    def find_key(self, name: str) -> Key | None:
+        return self._keys.find(name)
 
     def __str__(self):
         return str(self.name)
@@ -279,10 +387,68 @@ class Database(object):
 
     def __init__(self, name: Name = None):
         self.name = name
-        self.tables: List[Table] = []
+        self.tables = []
+
+    @property
+    def tables(self) -> List[Table]:
+        return self._tables
+
+    @tables.setter
+    def tables(self, tables: List[Table]) -> None:
+        self._tables = NamedList(tables)
 
     def get_table(self, table_name: str):
-        result = [table for table in self.tables if table.name.raw() == table_name]
-        if len(result) > 0:
-            return result[0]
-        return None
+        return self._tables.find(table_name)
+
+
+class TableDiff(object):
+    """ The changes that turn old_table into new_table. Keys are matched on their type and columns rather than their
+        name, since introspected and defined names rarely agree """
+    old_table: Table
+    new_table: Table
+    added_fields: list[Field]
+    dropped_fields: list[Field]
+    altered_fields: list[tuple[Field, Field]]
+    added_keys: list[Key]
+    dropped_keys: list[Key]
+    pk_changed: bool
+
+    def __init__(self, old_table: Table, new_table: Table):
+        self.old_table = old_table
+        self.new_table = new_table
+        self.added_fields: list[Field] = []
+        self.dropped_fields: list[Field] = []
+        # (old field, new field)
+        self.altered_fields: list[tuple[Field, Field]] = []
+        self.added_keys: list[Key] = []
+        self.dropped_keys: list[Key] = []
+        self.pk_changed = False
+
+    def has_column_changes(self) -> bool:
+        return len(self.added_fields) > 0 or len(self.dropped_fields) > 0 or len(self.altered_fields) > 0 \
+            or self.pk_changed
+
+    def has_changes(self) -> bool:
+        return self.has_column_changes() or len(self.added_keys) > 0 or len(self.dropped_keys) > 0
+
+    def __str__(self):
+        return str(self.new_table.name)
+
+
+class SchemaDiff(object):
+    """ The changes that turn the source database into the target """
+    source: Database
+    target: Database
+    added_tables: list[Table]
+    dropped_tables: list[Table]
+    altered_tables: list[TableDiff]
+
+    def __init__(self, source: Database, target: Database):
+        self.source = source
+        self.target = target
+        self.added_tables: list[Table] = []
+        self.dropped_tables: list[Table] = []
+        self.altered_tables: list[TableDiff] = []
+
+    def has_changes(self) -> bool:
+        return len(self.added_tables) > 0 or len(self.dropped_tables) > 0 or len(self.altered_tables) > 0
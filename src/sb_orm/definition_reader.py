@@ -0,0 +1,255 @@
+import json
+from typing import Any, Callable, Iterator, TextIO
+
+from sb_serializer import Naming, Name
+
+from src.sb_orm.database_objects import Database, Table, Field, Key, KeyType, FieldType, CustomQuery, Parameter, \
+    TransformType, QueryType, DataException, NamedList
+
+
+class DefinitionReader(object):
+    """ Incremental reader for the JSON written by Adaptor.generate_schema_definition. read() yields
+        (key, value, source) for each top level entry, and for each element of "tables" on its own, so only
+        one table is ever decoded at a time """
+    __chunk_size__ = 1 << 16
+
+    def __init__(self, input_file: TextIO):
+        self.input_file = input_file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> None:
+        if self.position > 0:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        chunk = self.input_file.read(size)
+        if chunk:
+            self.buffer += chunk
+        else:
+            self.eof = True
+
+    def _peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                return ""
+            self._fill(self.__chunk_size__)
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise DataException(f"Invalid definition file, expected {char}")
+        self.position += 1
+
+    def _at_end(self, close: str) -> bool:
+        """ Consumes the separator after a value, True when it closes the enclosing object or list """
+        char = self._peek()
+        self.position += 1
+        if char == ",":
+            return False
+        if char == close:
+            return True
+        raise DataException(f"Invalid definition file, expected , or {close}")
+
+    def _decode(self) -> tuple[Any, str]:
+        self._peek()
+        # a value needing more input is retried on a doubled read, which keeps huge tables linear
+        size = self.__chunk_size__
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number running into the end of the buffer may not be complete yet
+                if end < len(self.buffer) or self.eof:
+                    source = self.buffer[self.position:end]
+                    self.position = end
+                    return value, source
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise DataException("Invalid definition file")
+            self._fill(size)
+            size *= 2
+
+    def read(self) -> Iterator[tuple[str, Any, str]]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key, _ = self._decode()
+            self._expect(":")
+            if key == "tables":
+                self._expect("[")
+                if self._peek() == "]":
+                    self.position += 1
+                else:
+                    while True:
+                        value, source = self._decode()
+                        yield key, value, source
+                        if self._at_end("]"):
+                            break
+            else:
+                value, source = self._decode()
+                yield key, value, source
+            if self._at_end("}"):
+                break
+
+
+class DefinitionLoader(object):
+    """ Maps decoded definition entries onto the database objects. Empty values (the serializer writes None
+        as {}) map back to None. Table.foreign_keys is derived from the other tables' foreign keys rather than
+        read, so it is never duplicated """
+
+    def __init__(self, naming: Naming):
+        self.naming = naming
+        # the same column and key names recur across tables, so each is split into words only once
+        self.words: dict[str, list[str]] = {}
+        self.field_types: dict[str, FieldType] = {}
+
+    @staticmethod
+    def _value(value: Any, default: Any = None) -> Any:
+        return default if value is None or value == {} else value
+
+    def map_name(self, value: Any) -> Name | None:
+        value = self._value(value)
+        if value is None:
+            return None
+        words = self.words.get(value)
+        if words is None:
+            name = self.naming.string_to_name(value)
+            self.words[value] = list(name.words)
+            return name
+        # a Name of its own for every object, as names are mutable
+        name = Name(value)
+        name.words = list(words)
+        return name
+
+    def map_field_type(self, value: Any) -> FieldType:
+        value = self._value(value, "none")
+        field_type = self.field_types.get(value)
+        if field_type is None:
+            field_type = self.field_types.setdefault(value, FieldType.get_fieldtype(value))
+        return field_type
+
+    def map_field(self, source: dict) -> Field:
+        # called for every column of every table, so the lookups are inlined
+        get = source.get
+        size = get("size")
+        scale = get("scale")
+        auto_increment = get("auto_increment")
+        default = get("default")
+        required = get("required")
+        return Field(self.map_name(get("name")), self.map_field_type(get("type")),
+                     0 if size is None or size == {} else size, 0 if scale is None or scale == {} else scale,
+                     False if auto_increment is None or auto_increment == {} else auto_increment,
+                     None if default == {} else default,
+                     False if required is None or required == {} else required)
+
+    def map_key(self, source: dict, table_name: str) -> Key:
+        key = Key(self.map_name(source.get("name")),
+                  KeyType.get_keytype(self._value(source.get("key_type"), "undefined")),
+                  list(self._value(source.get("fields"), [])), self._value(source.get("primary_table"), ""),
+                  list(self._value(source.get("primary_fields"), [])))
+        key.referenced_table = self._value(source.get("referenced_table"), "") or table_name
+        return key
+
+    def map_query(self, source: dict) -> CustomQuery:
+        query = CustomQuery(self.map_name(source.get("name")))
+        query.parameters = [Parameter(self.map_name(p.get("name")), self.map_field_type(p.get("type")))
+                            for p in self._value(source.get("parameters"), [])]
+        query.return_type = self.map_field_type(source.get("return_type"))
+        query.transform = TransformType.get_transformtype(self._value(source.get("transform"), "undefined"))
+        query.query_type = QueryType.get_querytype(self._value(source.get("query_type"), "undefined"))
+        query.query = self._value(source.get("query"), "")
+        return query
+
+    def map_table(self, source: dict, key_factory: Callable[[int, dict], Key] | None = None) -> Table:
+        table_name = source["name"]
+        if key_factory is None:
+            key_factory = lambda index, key_source: self.map_key(key_source, table_name)
+        pk = self._value(source.get("pk"))
+        return Table(self.map_name(table_name), [self.map_field(f) for f in self._value(source.get("fields"), [])],
+                     None if pk is None else self.map_key(pk, table_name),
+                     [key_factory(i, k) for i, k in enumerate(self._value(source.get("keys"), []))], [],
+                     [self.map_query(q) for q in self._value(source.get("custom_queries"), [])])
+
+    def load(self, input_file: TextIO, lazy: bool = False) -> Database:
+        name = None
+        tables: list[Table] = []
+        sources: dict[str, str] = {}
+        # primary table name -> (foreign table name, key index, key source)
+        referencing: dict[str, list[tuple[str, int, dict]]] = {}
+        for key, value, source in DefinitionReader(input_file).read():
+            if key == "name":
+                name = value
+            elif key == "tables" and lazy:
+                sources[value["name"]] = source
+                for index, key_source in enumerate(self._value(value.get("keys"), [])):
+                    if KeyType.get_keytype(self._value(key_source.get("key_type"), "undefined")) == KeyType.ForeignKey:
+                        referencing.setdefault(key_source.get("primary_table"), []).append((value["name"], index,
+                                                                                           key_source))
+            elif key == "tables":
+                tables.append(self.map_table(value))
+
+        if lazy:
+            return LazyDatabase(self.map_name(name), self, sources, referencing)
+
+        database = Database(self.map_name(name))
+        database.tables = tables
+        for table in tables:
+            for foreign_key in [key for key in table.keys if key.key_type == KeyType.ForeignKey]:
+                primary_table = database.get_table(foreign_key.primary_table)
+                if primary_table is not None:
+                    primary_table.foreign_keys.append(foreign_key)
+        return database
+
+
+class LazyDatabase(Database):
+    """ Database over the raw source of each table, mapped on first use. get_table maps only the table asked for
+        (its foreign_keys come from the keys recorded while reading), reading tables maps them all """
+
+    def __init__(self, name: Name | None, loader: DefinitionLoader, sources: dict[str, str],
+                 referencing: dict[str, list[tuple[str, int, dict]]]):
+        super().__init__(name)
+        self.loader = loader
+        self.sources = sources
+        self.referencing = referencing
+        self.loaded: dict[str, Table] = {}
+        self.keys: dict[tuple[str, int], Key] = {}
+        self._tables = None
+
+    @property
+    def tables(self) -> list[Table]:
+        if self._tables is None:
+            self._tables = NamedList([self._load(name) for name in self.sources])
+        return self._tables
+
+    @tables.setter
+    def tables(self, tables: list[Table]) -> None:
+        self._tables = NamedList(tables)
+
+    def _get_key(self, table_name: str, index: int, source: dict) -> Key:
+        # foreign keys are shared between the foreign table's keys and the primary table's foreign_keys
+        key = self.keys.get((table_name, index))
+        if key is None:
+            key = self.keys.setdefault((table_name, index), self.loader.map_key(source, table_name))
+        return key
+
+    def _load(self, table_name: str) -> Table:
+        table = self.loaded.get(table_name)
+        if table is None:
+            table = self.loader.map_table(json.loads(self.sources[table_name]),
+                                          lambda index, source: self._get_key(table_name, index, source))
+            table.foreign_keys = [self._get_key(foreign_table, index, source)
+                                  for foreign_table, index, source in self.referencing.get(table_name, [])]
+            self.loaded[table_name] = table
+        return table
+
+    def get_table(self, table_name: str):
+        if self._tables is not None:
+            return super().get_table(table_name)
+        if table_name not in self.sources:
+            return None
+        return self._load(table_name)
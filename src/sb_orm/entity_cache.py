@@ -0,0 +1,146 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+from sb_db_common import Session
+
+
+def make_cache_key(table: type, id: dict) -> tuple:
+    return table, tuple(sorted(id.items()))
+
+
+class EntityCache(object):
+    """ Process wide LRU cache of fetched rows, keyed on (database, table class, pk dict), the database being the
+        connection string. Rows rather than entities are held so that callers never share a mutable instance.
+        A row written in a session's open transaction is not cached by any session until end_transaction(session)
+        is called after its commit or rollback (UnitOfWork does this), or the session is gone; until then it is
+        read from the database. """
+
+    def __init__(self, max_size: int = 1000, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        # keys written by open transactions, counted per key and listed per session
+        self._fences: dict[tuple, int] = {}
+        self._pending: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # reentrant as a collected session releases its keys from a finalizer, which may run while it is held
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _get_key(scope: str, table: type, id: dict) -> tuple:
+        return (scope,) + make_cache_key(table, id)
+
+    def get(self, scope: str, table: type, id: dict) -> Any | None:
+        key = self._get_key(scope, table, id)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._items[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, scope: str, table: type, id: dict, row: Any) -> None:
+        key = self._get_key(scope, table, id)
+        with self._lock:
+            if key in self._fences:
+                # uncommitted, or about to be replaced by an uncommitted write
+                return
+            self._items[key] = (time.monotonic(), row)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, session: Session, table: type, id: dict) -> None:
+        """ Drops the row and keeps it out of the cache until the session's transaction ends """
+        key = self._get_key(session.connection.connection_string, table, id)
+        with self._lock:
+            self._items.pop(key, None)
+            pending = self._pending.get(session)
+            if pending is None:
+                pending = set()
+                self._pending[session] = pending
+                weakref.finalize(session, self._release, pending)
+            if key not in pending:
+                pending.add(key)
+                self._fences[key] = self._fences.get(key, 0) + 1
+
+    def end_transaction(self, session: Session) -> None:
+        with self._lock:
+            pending = self._pending.pop(session, None)
+        if pending is not None:
+            self._release(pending)
+
+    def _release(self, pending: set[tuple]) -> None:
+        with self._lock:
+            for key in pending:
+                count = self._fences.pop(key, 1) - 1
+                if count > 0:
+                    self._fences[key] = count
+            pending.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class IdentityMap(object):
+    """ Per session map of loaded entities, so the same pk resolves to the same instance.
+        Enable it with IdentityMap.attach(session). """
+    __maps__: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._items: dict[tuple, Any] = {}
+
+    @classmethod
+    def attach(cls, session: Session) -> "IdentityMap":
+        identity_map = cls.__maps__.get(session)
+        if identity_map is None:
+            identity_map = cls()
+            cls.__maps__[session] = identity_map
+        return identity_map
+
+    @classmethod
+    def detach(cls, session: Session) -> None:
+        cls.__maps__.pop(session, None)
+
+    @classmethod
+    def for_session(cls, session: Session) -> "IdentityMap | None":
+        return cls.__maps__.get(session)
+
+    def get(self, table: type, id: dict) -> Any | None:
+        item = self._items.get(make_cache_key(table, id))
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return item
+
+    def put(self, table: type, id: dict, item: Any) -> None:
+        self._items[make_cache_key(table, id)] = item
+
+    def invalidate(self, table: type, id: dict) -> None:
+        self._items.pop(make_cache_key(table, id), None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+logger = logging.getLogger("sb_orm")
+
+
+class StatementEvent(object):
+    """ One statement issued through a repository. statement is the stable identity used for metrics
+        (for example TestTable.fetch_by_id), script the sql that ran. row_count is None where the driver
+        does not report it, wait is the connection checkout wait charged to this statement """
+    __slots__ = ("statement", "script", "parameter_count", "row_count", "elapsed", "wait", "error")
+
+    def __init__(self, statement: str, script: str, parameters: Any, wait: float = 0.0):
+        self.statement = statement
+        self.script = script
+        self.parameter_count = self.count_parameters(parameters)
+        self.row_count: int | None = None
+        self.elapsed = 0.0
+        self.wait = wait
+        self.error: Exception | None = None
+
+    @staticmethod
+    def count_parameters(parameters: Any) -> int:
+        if parameters is None:
+            return 0
+        if isinstance(parameters, dict):
+            return len(parameters)
+        # executemany style, a list of parameter sets
+        return sum([len(p) if isinstance(p, (dict, list, tuple)) else 1 for p in parameters])
+
+
+class Histogram(object):
+    """ Cumulative bucket counts in the Prometheus layout """
+    __default_buckets__ = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple[float, ...] | None = None):
+        self.buckets = tuple(sorted(buckets)) if buckets is not None else self.__default_buckets__
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def format(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{labels},le=\"{bound}\"}} {cumulative}")
+        lines.append(f"{name}_bucket{{{labels},le=\"+Inf\"}} {self.count}")
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class StatementMetrics(object):
+    def __init__(self, buckets: tuple[float, ...] | None):
+        self.duration = Histogram(buckets)
+        self.wait = Histogram(buckets)
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+
+class Instrumentation(object):
+    """ Timing hooks and per statement metrics for repositories.
+        Attach with RepositoryBase.__instrumentation__ = Instrumentation(...). Before hooks get the event before
+        the statement runs, after hooks once it has finished (or failed, with event.error set). Statements
+        slower than slow_threshold seconds go to the slow hooks, which log a warning unless others are added """
+
+    def __init__(self, slow_threshold: float | None = None, buckets: tuple[float, ...] | None = None):
+        self.slow_threshold = slow_threshold
+        self.buckets = buckets
+        self.before_hooks: list[Callable[[StatementEvent], None]] = []
+        self.after_hooks: list[Callable[[StatementEvent], None]] = []
+        self.slow_hooks: list[Callable[[StatementEvent], None]] = []
+        self.metrics: dict[str, StatementMetrics] = {}
+        self._lock = threading.Lock()
+
+    def add_before_hook(self, hook: Callable[[StatementEvent], None]) -> None:
+        self.before_hooks.append(hook)
+
+    def add_after_hook(self, hook: Callable[[StatementEvent], None]) -> None:
+        self.after_hooks.append(hook)
+
+    def add_slow_hook(self, hook: Callable[[StatementEvent], None]) -> None:
+        self.slow_hooks.append(hook)
+
+    @staticmethod
+    def log_slow_statement(event: StatementEvent) -> None:
+        logger.warning("Slow statement %s took %.3fs (%d parameters, %s rows): %s", event.statement, event.elapsed,
+                       event.parameter_count, event.row_count, event.script)
+
+    @contextmanager
+    def measure(self, statement: str, script: str, parameters: Any, wait: float = 0.0) -> Iterator[StatementEvent]:
+        """ Times the body as one statement. The body sets event.row_count where it knows it """
+        event = StatementEvent(statement, script, parameters, wait)
+        for hook in self.before_hooks:
+            hook(event)
+        start = time.perf_counter()
+        try:
+            yield event
+        except Exception as ex:
+            event.error = ex
+            raise
+        finally:
+            event.elapsed = time.perf_counter() - start
+            self.observe(event)
+
+    def observe(self, event: StatementEvent) -> None:
+        slow = self.slow_threshold is not None and event.elapsed >= self.slow_threshold
+        with self._lock:
+            metrics = self.metrics.get(event.statement)
+            if metrics is None:
+                metrics = self.metrics.setdefault(event.statement, StatementMetrics(self.buckets))
+            metrics.duration.observe(event.elapsed)
+            metrics.wait.observe(event.wait)
+            if event.row_count is not None:
+                metrics.rows += event.row_count
+            if event.error is not None:
+                metrics.errors += 1
+            if slow:
+                metrics.slow += 1
+
+        for hook in self.after_hooks:
+            hook(event)
+        if slow:
+            for hook in self.slow_hooks or [self.log_slow_statement]:
+                hook(event)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.metrics.clear()
+
+    def export_prometheus(self) -> str:
+        """ The metrics in the Prometheus text exposition format """
+        with self._lock:
+            items = sorted(self.metrics.items())
+            duration = ["# HELP sb_orm_statement_duration_seconds Statement wall time",
+                        "# TYPE sb_orm_statement_duration_seconds histogram"]
+            wait = ["# HELP sb_orm_connection_wait_seconds Connection checkout wait per statement",
+                    "# TYPE sb_orm_connection_wait_seconds histogram"]
+            rows = ["# HELP sb_orm_statement_rows_total Rows returned or written",
+                    "# TYPE sb_orm_statement_rows_total counter"]
+            errors = ["# HELP sb_orm_statement_errors_total Failed statements",
+                      "# TYPE sb_orm_statement_errors_total counter"]
+            slow = ["# HELP sb_orm_slow_statements_total Statements over the slow threshold",
+                    "# TYPE sb_orm_slow_statements_total counter"]
+            for statement, metrics in items:
+                labels = f"statement=\"{self.escape_label(statement)}\""
+                duration.extend(metrics.duration.format("sb_orm_statement_duration_seconds", labels))
+                wait.extend(metrics.wait.format("sb_orm_connection_wait_seconds", labels))
+                rows.append(f"sb_orm_statement_rows_total{{{labels}}} {metrics.rows}")
+                errors.append(f"sb_orm_statement_errors_total{{{labels}}} {metrics.errors}")
+                slow.append(f"sb_orm_slow_statements_total{{{labels}}} {metrics.slow}")
+        return "\n".join(duration + wait + rows + errors + slow) + "\n"
+
+    @staticmethod
+    def escape_label(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
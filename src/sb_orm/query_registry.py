@@ -0,0 +1,61 @@
+from typing import Any, Callable
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import CustomQuery, Table, TransformType, QueryType, DataException
+
+
+def int_to_bool(value: Any) -> Any:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return bool(value)
+    return value
+
+
+class CompiledQuery(object):
+    """ A CustomQuery with its ::parameter:: placeholders rewritten for one dialect """
+    name: str
+    script: str
+    query_type: QueryType
+    transform: TransformType
+    parameters: list[str]
+
+    def __init__(self, query: CustomQuery, adaptor: Adaptor):
+        self.name = query.name.raw()
+        self.script = adaptor.replace_parameters(query.query)
+        self.query_type = query.query_type
+        self.transform = query.transform
+        self.parameters = [p.name.raw() for p in query.parameters]
+
+    def check_parameters(self, parameters: dict) -> None:
+        missing = [p for p in self.parameters if p not in parameters]
+        if len(missing) > 0:
+            raise DataException(f"Missing parameters {', '.join(missing)} for query {self.name}")
+
+    def transform_scalar(self, value: Any) -> Any:
+        if self.transform == TransformType.IntToBool:
+            return int_to_bool(value)
+        return value
+
+    def transform_rows(self, rows: list, mapper: Callable[[Any], Any]) -> list:
+        """ Applies the transform to the whole result set in one pass """
+        if self.transform == TransformType.Map:
+            return list(map(mapper, rows))
+        elif self.transform == TransformType.IntToBool:
+            # only a single column result is a flag, wider rows hold ids and counts that stay integers
+            if len(rows) == 0 or len(rows[0]) != 1:
+                return rows
+            return [(int_to_bool(row[0]),) for row in rows]
+        return rows
+
+
+class QueryRegistry(object):
+    """ The custom queries of one table compiled for one dialect, looked up by name """
+
+    def __init__(self, table: Table, adaptor: Adaptor):
+        self.queries: dict[str, CompiledQuery] = {query.name.raw(): CompiledQuery(query, adaptor)
+                                                  for query in table.custom_queries}
+
+    def get(self, name: str) -> CompiledQuery:
+        query = self.queries.get(name)
+        if query is None:
+            raise DataException(f"Unknown query {name}")
+        return query
@@ -1,73 +1,319 @@
-from typing import Any, TypeVar
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, TypeVar, Iterable, Iterator, Sequence, Callable
 
 from sb_db_common import Session, DataException
 
 from src.sb_orm import TableBase
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.columnar import to_column
+from src.sb_orm.connection_pool import ConnectionPool
+from src.sb_orm.database_objects import QueryType, KeyType
+from src.sb_orm.entity_cache import EntityCache, IdentityMap
+from src.sb_orm.instrumentation import Instrumentation, StatementEvent, logger
+from src.sb_orm.statement_cache import StatementCache, TableStatements
 
 # T = TypeVar("T", bound=TableBase)
 
 
 class RepositoryBase:
     __table__ : type
+    __entity_cache__: EntityCache | None = None
+    # a statement that cannot be prepared runs unprepared, a prepared statement that fails always raises
+    __prepared_statements__ = False
+    __instrumentation__: Instrumentation | None = None
+    __max_workers__ = 8
+    __executors__: dict[type, Executor] = {}
+    __executor_lock__ = threading.Lock()
+
+    @classmethod
+    def _get_adaptor(cls, session: Session) -> Adaptor:
+        return StatementCache.get_adaptor_for_session(session)
+
+    @classmethod
+    def _get_statements(cls, session: Session) -> TableStatements:
+        return StatementCache.get_statements(cls.__table__.__table_definition__, cls._get_adaptor(session))
+
+    @classmethod
+    def _get_statement_name(cls, session: Session, script: str, statement: str | None) -> str:
+        if statement is None:
+            statement = cls._get_statements(session).get_name(script)
+            if statement is None:
+                # ad hoc sql is keyed on its text, so the metrics stay bounded by the distinct queries issued
+                statement = "sql:" + hashlib.sha1(script.encode("utf-8")).hexdigest()[:12]
+        return f"{cls.__table__.__name__}.{statement}"
+
+    @classmethod
+    @contextmanager
+    def _measure(cls, session: Session, script: str, parameters: Any,
+                 statement: str | None = None) -> Iterator[StatementEvent]:
+        """ Times one statement through the attached instrumentation. statement defaults to the name of a
+            generated script, the body fills in event.row_count where it knows it """
+        instrumentation = cls.__instrumentation__
+        if instrumentation is None:
+            yield StatementEvent("", script, None)
+            return
+        wait = getattr(session, "checkout_wait", 0.0)
+        if wait:
+            session.checkout_wait = 0.0
+        with instrumentation.measure(cls._get_statement_name(session, script, statement), script, parameters,
+                                     wait) as event:
+            yield event
 
     @classmethod
     def drop_schema(cls, session: Session) -> None:
-        cls._execute(session, cls.__table__.__drop_script__)
+        cls._execute(session, cls._get_statements(session).drop)
 
     def schema_exists(self, session: Session) -> bool:
-        script = self.__table__.__table_exists_script__.format(database=session.connection.database)
-        result = self._fetch_scalar(session, script)
+        script = self._get_statements(session).table_exists.format(database=session.connection.database)
+        result = self._fetch_scalar(session, script, statement="table_exists")
         return result != 0
 
     def create_schema(self, session: Session) -> None:
-        script = list(filter(None, self.__table__.__create_script__.split(";")))
+        script = list(filter(None, self._get_statements(session).create.split(";")))
         for line in [s for s in script if s.strip() != ""]:
-            self._execute(session, line + ";")
+            self._execute(session, line + ";", statement="create")
 
-    @staticmethod
-    def _fetch_scalar(session: Session, query: str, parameters: None | dict = None) -> Any | None:
+    @classmethod
+    def _fetch_scalar(cls, session: Session, query: str, parameters: None | dict = None,
+                      statement: str | None = None) -> Any | None:
         if parameters is None:
             parameters = {}
-        return session.fetch_scalar(query, parameters)
+        with cls._measure(session, query, parameters, statement) as event:
+            row = session.fetch_one(query, parameters)
+            event.row_count = 0 if row is None else 1
+        return row[0] if row is not None else None
 
-    @staticmethod
-    def _fetch_one_row(session: Session, query: str, parameters: None | dict = None) -> Any | None:
+    @classmethod
+    def _fetch_one_row(cls, session: Session, query: str, parameters: None | dict = None,
+                       statement: str | None = None) -> Any | None:
         if parameters is None:
             parameters = {}
-        return session.fetch_one(query, parameters)
+        with cls._measure(session, query, parameters, statement) as event:
+            row = session.fetch_one(query, parameters)
+            event.row_count = 0 if row is None else 1
+        return row
 
-    @staticmethod
-    def _execute(session: Session, query: str, parameters: None | dict = None) -> None:
+    @classmethod
+    def _execute(cls, session: Session, query: str, parameters: None | dict = None,
+                 statement: str | None = None) -> None:
         try:
             if parameters is None:
                 parameters = {}
-            session.execute(query, parameters)
-        except Exception as ex:
-            print(ex)
+            with cls._measure(session, query, parameters, statement):
+                session.execute(query, parameters)
+        except Exception:
+            logger.exception("Statement failed: %s", query)
 
-    @staticmethod
-    def _execute_lastrowid(session: Session, query: str, parameters: None | dict = None) -> Any:
+    @classmethod
+    def _execute_lastrowid(cls, session: Session, query: str, parameters: None | dict = None,
+                           statement: str | None = None) -> Any:
         try:
             if parameters is None:
                 parameters = {}
-            value = session.execute_lastrowid(query, parameters)
+            with cls._measure(session, query, parameters, statement) as event:
+                value = session.execute_lastrowid(query, parameters)
+                event.row_count = 1
+            return value
+        except Exception:
+            logger.exception("Statement failed: %s", query)
+
+    def _statement_fetch_one(self, session: Session, script: str, parameters: dict) -> Any | None:
+        if self.__prepared_statements__:
+            with self._measure(session, script, parameters) as event:
+                row = self._get_adaptor(session).fetch_one_prepared(session, script, parameters)
+                event.row_count = 0 if row is None else 1
+            return row
+        return self._fetch_one_row(session, script, parameters)
+
+    def _statement_execute(self, session: Session, script: str, parameters: dict) -> None:
+        if self.__prepared_statements__:
+            with self._measure(session, script, parameters):
+                self._get_adaptor(session).execute_prepared(session, script, parameters)
+        else:
+            self._execute(session, script, parameters)
+
+    def _statement_execute_lastrowid(self, session: Session, script: str, parameters: dict) -> Any:
+        if self.__prepared_statements__:
+            with self._measure(session, script, parameters) as event:
+                value = self._get_adaptor(session).execute_lastrowid_prepared(session, script, parameters)
+                event.row_count = 1
             return value
-        except Exception as ex:
-            print(ex)
+        return self._execute_lastrowid(session, script, parameters)
+
+    def _map_row(self, row) -> TableBase:
+        item = self.__table__().map_row(row)
+        item._loaded_state = row
+        return item
+
+    def _get_cached(self, scope: str, identity_map: IdentityMap | None, id: dict) -> TableBase | None:
+        if identity_map is not None:
+            item = identity_map.get(self.__table__, id)
+            if item is not None:
+                return item
+        if self.__entity_cache__ is not None:
+            row = self.__entity_cache__.get(scope, self.__table__, id)
+            if row is not None:
+                item = self._map_row(row)
+                if identity_map is not None:
+                    identity_map.put(self.__table__, id, item)
+                return item
+        return None
+
+    def _put_cached(self, scope: str, identity_map: IdentityMap | None, id: dict, row: Any,
+                    item: TableBase) -> None:
+        if self.__entity_cache__ is not None:
+            self.__entity_cache__.put(scope, self.__table__, id, row)
+        if identity_map is not None:
+            identity_map.put(self.__table__, id, item)
 
     def fetch_by_id(self, session: Session, id: None | dict) -> TableBase | None:
         if id is None:
             raise DataException("id cannot be null")
-        row = self._fetch_one_row(session, self.__table__.__fetch_by_id_script__, id)
+        scope = session.connection.connection_string
+        identity_map = IdentityMap.for_session(session)
+        item = self._get_cached(scope, identity_map, id)
+        if item is not None:
+            return item
+
+        row = self._statement_fetch_one(session, self._get_statements(session).fetch_by_id, id)
         if row:
-            return self.__table__().map_row(row)
+            item = self._map_row(row)
+            self._put_cached(scope, identity_map, id, row, item)
+            return item
         return None
 
+    def fetch_by_ids(self, session: Session, ids: list[dict], batch_size: int = 1000) -> list[TableBase | None]:
+        """ Loads many rows by primary key with IN-list queries. The result lines up with ids and holds None
+            for every id that has no row """
+        table = self.__table__.__table_definition__
+        adaptor = self._get_adaptor(session)
+        pk_fields = table.pk.fields
+        pk_indexes = [table.fields.index(table.find_field(f)) for f in pk_fields]
+        scope = session.connection.connection_string
+        identity_map = IdentityMap.for_session(session)
+
+        found: dict[tuple, TableBase] = {}
+        pending: dict[tuple, dict] = {}
+        for id in ids:
+            if id is None:
+                raise DataException("id cannot be null")
+            key = tuple([id[f] for f in pk_fields])
+            if key in found or key in pending:
+                continue
+            item = self._get_cached(scope, identity_map, id)
+            if item is not None:
+                found[key] = item
+            else:
+                pending[key] = id
+
+        batch_size = adaptor.get_fetch_by_ids_batch_size(table, batch_size)
+        for batch in self._batch(pending.values(), batch_size):
+            script = adaptor.generate_fetch_by_ids_script(table, len(batch))
+            params = adaptor.get_fetch_by_ids_params(table, batch)
+            with self._measure(session, script, params, "fetch_by_ids") as event:
+                with session.fetch(script, params) as cursor:
+                    rows = cursor.fetchall()
+                event.row_count = len(rows)
+            for row in rows:
+                key = tuple([row[i] for i in pk_indexes])
+                item = self._map_row(row)
+                found[key] = item
+                self._put_cached(scope, identity_map, dict(zip(pk_fields, key)), row, item)
+
+        return [found.get(tuple([id[f] for f in pk_fields])) for id in ids]
+
+    @classmethod
+    def _get_shared_executor(cls) -> Executor:
+        # one per repository class, so each runs with its own __max_workers__
+        with RepositoryBase.__executor_lock__:
+            executor = RepositoryBase.__executors__.get(cls)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=cls.__max_workers__,
+                                              thread_name_prefix=f"sb_orm_{cls.__name__}")
+                RepositoryBase.__executors__[cls] = executor
+            return executor
+
+    def run_parallel(self, pool: ConnectionPool, calls: list[Callable[[Session], Any]],
+                     executor: Executor | None = None) -> list[Any]:
+        """ Runs each call on the shared executor (or the one given) with a session of its own, checked out of
+            pool and committed and handed back when the call returns. Results come back in the order of calls,
+            the first failure is raised once every call has finished. Calls must not run parallel work
+            themselves, as they would wait on the same executor """
+        def run(call: Callable[[Session], Any]) -> Any:
+            with pool.session() as session:
+                return call(session)
+
+        if executor is None:
+            executor = self._get_shared_executor()
+        futures = [executor.submit(run, call) for call in calls]
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def fetch_by_ids_parallel(self, pool: ConnectionPool, ids: list[dict], batch_size: int = 1000,
+                              executor: Executor | None = None,
+                              session: Session | None = None) -> list[TableBase | None]:
+        """ fetch_by_ids with the distinct ids split into batch_size chunks, each fetched on its own pooled
+            connection. The result lines up with ids as fetch_by_ids' does. The pooled sessions have no identity
+            map; pass the caller's session to serve ids from its map and merge the fetched items into it """
+        pk_fields = self.__table__.__table_definition__.pk.fields
+        identity_map = None if session is None else IdentityMap.for_session(session)
+        found: dict[tuple, TableBase | None] = {}
+        unique: dict[tuple, dict] = {}
+        for id in ids:
+            if id is None:
+                raise DataException("id cannot be null")
+            key = tuple([id[f] for f in pk_fields])
+            if key in found or key in unique:
+                continue
+            item = self._get_cached(pool.connection_string, identity_map, id)
+            if item is not None:
+                found[key] = item
+            else:
+                unique[key] = id
+
+        chunks = list(self._batch(unique.values(), batch_size))
+        results = self.run_parallel(pool, [lambda session, chunk=chunk: self.fetch_by_ids(session, chunk, batch_size)
+                                           for chunk in chunks], executor)
+        for chunk, items in zip(chunks, results):
+            for id, item in zip(chunk, items):
+                found[tuple([id[f] for f in pk_fields])] = item
+                if identity_map is not None and item is not None:
+                    identity_map.put(self.__table__, id, item)
+        return [found.get(tuple([id[f] for f in pk_fields])) for id in ids]
+
+    def fetch_multiple_parallel(self, pool: ConnectionPool, queries: list[tuple[str, dict | None]],
+                                executor: Executor | None = None) -> list[list[TableBase] | None]:
+        """ Runs fetch_multiple for each (query, parameters) on its own pooled connection, results in query order """
+        return self.run_parallel(pool, [lambda session, query=query, parameters=parameters:
+                                        self.fetch_multiple(session, query, parameters)
+                                        for query, parameters in queries], executor)
+
+    def _invalidate(self, session: Session, id: dict) -> None:
+        if self.__entity_cache__ is not None:
+            self.__entity_cache__.invalidate(session, self.__table__, id)
+        identity_map = IdentityMap.for_session(session)
+        if identity_map is not None:
+            identity_map.invalidate(self.__table__, id)
+
+    def _get_pk(self, item: TableBase) -> dict:
+        params = item.get_update_params()
+        return {f: params[f] for f in self.__table__.__table_definition__.pk.fields}
+
     def _item_exists(self, session: Session, id: None | dict):
         if id is None:
             raise DataException("id cannot be null")
-        cnt = self._fetch_scalar(session, self.__table__.__item_exists_script__, id)
-        return cnt > 0
+        row = self._statement_fetch_one(session, self._get_statements(session).item_exists, id)
+        return row is not None and row[0] > 0
 
     def fetch_one(self, session: Session, query: str, parameters: None | dict = None) -> TableBase | None:
         try:
@@ -75,31 +321,290 @@ class RepositoryBase:
                 parameters = {}
             row = self._fetch_one_row(session, query, parameters)
             if row:
-                return self.__table__().map_row(row)
+                return self._map_row(row)
             return None
-        except Exception as ex:
-            print(ex)
+        except Exception:
+            logger.exception("Statement failed: %s", query)
 
     def fetch_multiple(self, session: Session, query: str, parameters: None | dict = None) -> None | list[TableBase]:
         try:
             if parameters is None:
                 parameters = {}
-            with session.fetch(query, parameters) as cursor:
-                return [self.__table__().map_row(row) for row in cursor]
-        except Exception as ex:
-            print(ex)
+            with self._measure(session, query, parameters) as event:
+                with session.fetch(query, parameters) as cursor:
+                    rows = cursor.fetchall()
+                event.row_count = len(rows)
+            return [self._map_row(row) for row in rows]
+        except Exception:
+            logger.exception("Statement failed: %s", query)
+
+    def iter_multiple(self, session: Session, query: str, parameters: None | dict = None,
+                      chunk_size: int = 1000) -> Iterator[TableBase]:
+        if parameters is None:
+            parameters = {}
+        adaptor = self._get_adaptor(session)
+        cursor = adaptor.new_stream_cursor(session, chunk_size)
+        try:
+            # only the execute is timed, the fetches interleave with the caller's own work
+            with self._measure(session, query, parameters):
+                cursor.execute(query, parameters)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._map_row(row)
+        finally:
+            adaptor.close_stream_cursor(session, cursor)
+
+    def fetch_columns(self, session: Session, query: str, parameters: None | dict = None,
+                      chunk_size: int = 10000) -> dict[str, Any]:
+        """ Returns the result set as a dict of column name to numpy array (array.array or list without numpy),
+            typed from the table's field definitions. No entity is created per row """
+        if parameters is None:
+            parameters = {}
+        table = self.__table__.__table_definition__
+        adaptor = self._get_adaptor(session)
+        cursor = adaptor.new_stream_cursor(session, chunk_size)
+        try:
+            with self._measure(session, query, parameters) as event:
+                cursor.execute(query, parameters)
+                # a postgres named cursor has no description until its first fetch
+                rows = cursor.fetchmany(chunk_size)
+                names = [column[0] for column in cursor.description]
+                values: list[list] = [[] for _ in names]
+                event.row_count = 0
+                while rows:
+                    event.row_count += len(rows)
+                    for column, chunk in zip(values, zip(*rows)):
+                        column.extend(chunk)
+                    rows = cursor.fetchmany(chunk_size)
+        finally:
+            adaptor.close_stream_cursor(session, cursor)
+
+        fields = {f.name.raw().lower(): f for f in table.fields}
+        return {name: to_column(column, fields.get(name.lower())) for name, column in zip(names, values)}
+
+    def execute_query(self, session: Session, name: str, parameters: None | dict = None) -> Any:
+        """ Runs one of the table's custom queries by name, dispatching on its query type """
+        if parameters is None:
+            parameters = {}
+        query = self._get_statements(session).queries.get(name)
+        query.check_parameters(parameters)
+
+        if query.query_type == QueryType.FetchScalar:
+            return query.transform_scalar(self._fetch_scalar(session, query.script, parameters))
+        elif query.query_type == QueryType.FetchOne:
+            row = self._fetch_one_row(session, query.script, parameters)
+            if row is None:
+                return None
+            return query.transform_rows([row], self._map_row)[0]
+        elif query.query_type == QueryType.FetchAll:
+            with self._measure(session, query.script, parameters) as event:
+                with session.fetch(query.script, parameters) as cursor:
+                    rows = cursor.fetchall()
+                event.row_count = len(rows)
+            return query.transform_rows(rows, self._map_row)
+        elif query.query_type == QueryType.Execute:
+            with self._measure(session, query.script, parameters):
+                session.execute(query.script, parameters)
+            return None
+        raise DataException(f"Query {name} has no query type")
+
+    def _get_keyset_fields(self, order_by: str | None) -> tuple[str, ...]:
+        table = self.__table__.__table_definition__
+        if order_by is None:
+            return tuple(table.pk.fields)
+        key = table.find_key(order_by)
+        if key is None or key.key_type not in (KeyType.Index, KeyType.Unique):
+            raise DataException(f"No index or unique key named {order_by}")
+        # a row value comparison against null is never true, so rows with nulls would be skipped or repeated
+        nullable = [f for f in key.fields if not table.find_field(f).required]
+        if len(nullable) > 0:
+            raise DataException(f"Cannot page on {order_by}, {', '.join(nullable)} may be null")
+        # the primary key breaks ties so that the order is total even on a plain index
+        return tuple(key.fields + [f for f in table.pk.fields if f not in key.fields])
+
+    @staticmethod
+    def _encode_key_value(value: Any) -> Any:
+        # json carries strings and numbers as they are, other key types travel tagged with their type
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, datetime.datetime):
+            return {"datetime": value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {"date": value.isoformat()}
+        if isinstance(value, datetime.time):
+            return {"time": value.isoformat()}
+        if isinstance(value, decimal.Decimal):
+            return {"decimal": str(value)}
+        if isinstance(value, (bytes, bytearray)):
+            return {"bytes": base64.b64encode(value).decode("ascii")}
+        raise DataException(f"Cannot page on a key of type {type(value).__name__}")
+
+    @staticmethod
+    def _decode_key_value(value: Any) -> Any:
+        if not isinstance(value, dict):
+            return value
+        if len(value) != 1:
+            raise ValueError("Invalid key value")
+        tag, text = next(iter(value.items()))
+        if tag == "datetime":
+            return datetime.datetime.fromisoformat(text)
+        if tag == "date":
+            return datetime.date.fromisoformat(text)
+        if tag == "time":
+            return datetime.time.fromisoformat(text)
+        if tag == "decimal":
+            return decimal.Decimal(text)
+        if tag == "bytes":
+            return base64.b64decode(text)
+        raise ValueError(f"Unknown key type {tag}")
+
+    @classmethod
+    def _encode_token(cls, values: list) -> str:
+        return base64.urlsafe_b64encode(json.dumps([cls._encode_key_value(value) for value in values])
+                                        .encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def _decode_token(cls, token: str) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+            if not isinstance(values, list):
+                raise ValueError("Invalid token")
+            return [cls._decode_key_value(value) for value in values]
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            raise DataException("Invalid continuation token")
+
+    def paginate(self, session: Session, after: str | None = None, limit: int = 100, order_by: str | None = None,
+                 descending: bool = False) -> tuple[list[TableBase], str | None]:
+        """ Keyset pagination over the primary key, or the Index/Unique key named by order_by, whose fields must
+            all be required.
+            Returns a page of items and the token for the next page, which is None on the last page """
+        table = self.__table__.__table_definition__
+        fields = self._get_keyset_fields(order_by)
+        parameters: dict = {"limit": limit + 1}
+        if after is not None:
+            values = self._decode_token(after)
+            if len(values) != len(fields):
+                raise DataException("Invalid continuation token")
+            parameters.update({f"after_{f}": value for f, value in zip(fields, values)})
+
+        script = self._get_statements(session).get_keyset(fields, descending, after is not None)
+        with self._measure(session, script, parameters) as event:
+            with session.fetch(script, parameters) as cursor:
+                rows = cursor.fetchall()
+            event.row_count = len(rows)
+
+        token = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            indexes = [table.fields.index(table.find_field(f)) for f in fields]
+            token = self._encode_token([rows[-1][i] for i in indexes])
+        return [self._map_row(row) for row in rows], token
 
     def count_all(self, session: Session):
-        script = self.__table__.__table_count_script__
+        script = self._get_statements(session).count
         return self._fetch_scalar(session, script)
 
     def add(self, session: Session, item: TableBase):
         pass
 
+    @staticmethod
+    def _batch(items: Iterable[Any], batch_size: int) -> Iterator[list[Any]]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def add_many(self, session: Session, items: Iterable[TableBase], batch_size: int = 500) -> list[Any]:
+        table = self.__table__.__table_definition__
+        adaptor = self._get_adaptor(session)
+        statements = self._get_statements(session)
+        autoinc_fields = [f.name.raw() for f in table.fields if f.auto_increment]
+        batch_size = adaptor.get_insert_batch_size(table, batch_size)
+        ids = []
+        for batch in self._batch(items, batch_size):
+            params = [item.get_insert_params() for item in batch]
+            with self._measure(session, statements.insert, params, "insert_many") as event:
+                batch_ids = adaptor.execute_insert_many(session, table, params)
+                event.row_count = len(batch)
+            for index, item in enumerate(batch):
+                if len(autoinc_fields) > 0 and index < len(batch_ids):
+                    setattr(item, autoinc_fields[0], batch_ids[index])
+                item.mark_loaded(item.get_update_params())
+                if self.__entity_cache__ is not None:
+                    # keeps the uncommitted row out of the shared cache
+                    self.__entity_cache__.invalidate(session, self.__table__, self._get_pk(item))
+            ids.extend(batch_ids)
+        return ids
+
+    def _get_update_script(self, statements: TableStatements, item: TableBase) -> str | None:
+        """ The update script covering the item's changed columns, or None when there is nothing to write """
+        changed = item.get_changed_fields()
+        if changed is None:
+            return statements.update
+        pk_fields = self.__table__.__table_definition__.pk.fields
+        changed = [f for f in changed if f not in pk_fields]
+        if len(changed) == 0:
+            return None
+        return statements.get_partial_update(changed)
+
+    def bulk_load(self, session: Session, rows: Iterable[Sequence], batch_size: int = 10000,
+                  commit: bool = False) -> int:
+        """ Streams rows through the dialect's native bulk path (COPY, sqlite executemany, LOAD DATA, multi-row
+            inserts). Each row holds the table's non auto increment fields in definition order. Pass commit, after
+            committing the session, to have the load committed on its own; sqlite then loads with synchronous off
+            and mysql with LOAD DATA LOCAL on a connection of its own """
+        with self._measure(session, self._get_statements(session).insert, None, "bulk_load") as event:
+            event.row_count = self._get_adaptor(session).bulk_load(session, self.__table__.__table_definition__,
+                                                                   rows, batch_size, commit)
+        return event.row_count
+
     def update(self, session: Session, item: TableBase):
-        self._execute(session, item.__update_script__, item.get_update_params())
+        script = self._get_update_script(self._get_statements(session), item)
+        if script is None:
+            return
+        params = item.get_update_params()
+        self._statement_execute(session, script, params)
+        item.mark_loaded(params)
+        self._invalidate(session, self._get_pk(item))
+
+    def update_many(self, session: Session, items: Iterable[TableBase], batch_size: int = 500) -> None:
+        adaptor = self._get_adaptor(session)
+        statements = self._get_statements(session)
+        for batch in self._batch(items, batch_size):
+            groups: dict[str, list[TableBase]] = {}
+            for item in batch:
+                script = self._get_update_script(statements, item)
+                if script is not None:
+                    groups.setdefault(script, []).append(item)
+
+            for script, group in groups.items():
+                params = [item.get_update_params() for item in group]
+                with self._measure(session, script, params, "update_many") as event:
+                    adaptor.execute_many(session, script, params)
+                    event.row_count = len(params)
+                for item, item_params in zip(group, params):
+                    item.mark_loaded(item_params)
+                    self._invalidate(session, self._get_pk(item))
+
+    def delete_many(self, session: Session, ids: Iterable[dict], batch_size: int = 500) -> None:
+        adaptor = self._get_adaptor(session)
+        script = self._get_statements(session).delete
+        for batch in self._batch(ids, batch_size):
+            with self._measure(session, script, batch, "delete_many") as event:
+                adaptor.execute_many(session, script, batch)
+                event.row_count = len(batch)
+            for id in batch:
+                self._invalidate(session, id)
 
     def _delete_row(self, session: Session, id: None | dict):
         if id is None:
             raise DataException("id cannot be null")
-        self._execute(session, self.__table__.__delete_script__, id)
+        self._statement_execute(session, self._get_statements(session).delete, id)
+        self._invalidate(session, id)
@@ -0,0 +1,50 @@
+import datetime
+from typing import Any, Iterable, Iterator, Sequence
+
+
+def format_text_value(value: Any) -> str:
+    """ Formats a value for tab delimited text loads: COPY's text format, and MySqlAdaptor's LOAD DATA which
+        spells out the same tab, backslash escape and newline """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    text = str(value)
+    if "\\" in text or "\t" in text or "\n" in text or "\r" in text:
+        text = text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return text
+
+
+def format_text_row(row: Sequence[Any]) -> str:
+    return "\t".join([format_text_value(value) for value in row]) + "\n"
+
+
+class TextRowStream(object):
+    """ Read-only file object producing tab delimited text from an iterable of rows on demand,
+        so a load never holds more than one read's worth of rows in memory """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self.rows: Iterator[Sequence[Any]] = iter(rows)
+        self.row_count = 0
+        self.buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = format_text_row(row)
+            parts.append(line)
+            length += len(line)
+            self.row_count += 1
+
+        text = "".join(parts)
+        if size < 0 or size >= len(text):
+            self.buffer = ""
+            return text
+        self.buffer = text[size:]
+        return text[:size]
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+
+from sb_serializer import Naming, HardSerializer
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import Database
+
+
+class SchemaCache(object):
+    """ Keeps Database snapshots on local disk, keyed by the schema's fingerprint, so an unchanged schema is
+        unpickled instead of re-introspected. Snapshots are pickles, so the directory must be trusted """
+    __version__ = 2
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, *parts: str) -> str:
+        digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.schema")
+
+    def _read(self, path: str, fingerprint: str) -> Database | None:
+        try:
+            with open(path, "rb") as input_file:
+                version, cached_fingerprint, database = pickle.load(input_file)
+        except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+            return None
+        if version != self.__version__ or cached_fingerprint != fingerprint:
+            return None
+        return database
+
+    def _write(self, path: str, fingerprint: str, database: Database) -> None:
+        # written aside and renamed so a concurrent reader never sees half a snapshot
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as output_file:
+                pickle.dump((self.__version__, fingerprint, database), output_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def import_schema(self, adaptor: Adaptor, db_name: str | None = None) -> Database:
+        """ adaptor.import_schema, served from the snapshot while the dialect's fingerprint is unchanged """
+        fingerprint = adaptor.get_schema_fingerprint(db_name)
+        if fingerprint is None:
+            return adaptor.import_schema(db_name)
+
+        # the password never reaches the cache key
+        connection = re.sub(r"(://[^:/@]+):[^@]*@", r"\1@", adaptor.connection)
+        path = self._get_path(adaptor.__dialect__, connection, db_name or "")
+        database = self._read(path, fingerprint)
+        if database is None:
+            database = adaptor.import_schema(db_name)
+            self._write(path, fingerprint, database)
+        return database
+
+    def import_definition(self, definition_file: str, naming: Naming, serializer: HardSerializer) -> Database:
+        """ Adaptor.import_definition, served from the snapshot while the file's size and mtime are unchanged """
+        stat = os.stat(definition_file)
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        path = self._get_path("definition", os.path.abspath(definition_file))
+        database = self._read(path, fingerprint)
+        if database is None:
+            database = Adaptor.import_definition(definition_file, naming, serializer)
+            self._write(path, fingerprint, database)
+        return database
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith(".schema"):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import Database, Table
+
+
+class SchemaDeployer(object):
+    """ Creates or drops every table of a Database through an adaptor, a dependency level at a time.
+        With a pool attached to the adaptor the tables of a level run concurrently, one pooled connection each,
+        otherwise one after the other on a single connection. create(defer_indexes=True) leaves the unique and
+        plain indexes for create_indexes(), to be run once the data has been loaded """
+
+    def __init__(self, database: Database, adaptor: Adaptor, max_workers: int = 8):
+        self.database = database
+        self.adaptor = adaptor
+        self.max_workers = max_workers
+        # table name -> index scripts still to run
+        self.deferred_indexes: dict[str, list[str]] = {}
+
+    @staticmethod
+    def _execute(connection: Any, scripts: list[str]) -> None:
+        cursor = connection.cursor()
+        try:
+            for script in scripts:
+                cursor.execute(script)
+        finally:
+            cursor.close()
+        # pooled connections are rolled back on release, so DDL on transactional dialects is committed here
+        connection.commit()
+
+    def _run_pooled(self, scripts: list[str]) -> None:
+        with self.adaptor.connect() as connection:
+            self._execute(connection, scripts)
+
+    def _run(self, batches: list[list[str]]) -> None:
+        """ Runs independent batches of scripts, each batch in order on one connection """
+        batches = [batch for batch in batches if len(batch) > 0]
+        if len(batches) == 0:
+            return
+        if self.adaptor.pool is None or len(batches) == 1:
+            with self.adaptor.connect() as connection:
+                for batch in batches:
+                    self._execute(connection, batch)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            for future in [executor.submit(self._run_pooled, batch) for batch in batches]:
+                future.result()
+
+    def _run_levels(self, levels: list[list[Table]], get_scripts: Callable[[Table], list[str]]) -> None:
+        for level in levels:
+            self._run([get_scripts(table) for table in level])
+
+    def _get_create_scripts(self, table: Table, defer_indexes: bool) -> list[str]:
+        index_scripts = self.adaptor.generate_create_index_scripts(table)
+        if defer_indexes:
+            self.deferred_indexes[table.name.raw()] = index_scripts
+            return [self.adaptor.generate_create_table_script(table)]
+        return [self.adaptor.generate_create_table_script(table)] + index_scripts
+
+    def create(self, defer_indexes: bool = False) -> None:
+        """ Creates the tables in foreign key order, the tables of each level concurrently """
+        self._run_levels(Adaptor.get_table_levels(self.database),
+                         lambda table: self._get_create_scripts(table, defer_indexes))
+
+    def create_indexes(self) -> None:
+        """ Builds the indexes held back by create(defer_indexes=True), the tables concurrently """
+        self._run(list(self.deferred_indexes.values()))
+        self.deferred_indexes = {}
+
+    def drop(self) -> None:
+        """ Drops the tables in reverse foreign key order """
+        self._run_levels(list(reversed(Adaptor.get_table_levels(self.database))),
+                         lambda table: [self.adaptor.generate_drop_script(table)])
@@ -0,0 +1,62 @@
+from typing import List
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import Database, Table, Key, KeyType, TableDiff, SchemaDiff
+
+
+class SchemaDiffer(object):
+    """ Compares two Database models, typically adaptor.import_schema() against Adaptor.import_definition(), and
+        produces the DDL that moves the first onto the second without recreating the tables. Fields are matched by
+        name, case insensitively, and compared through the adaptor's column definition, so only differences the
+        dialect can express count. A renamed field shows as a drop and an add """
+
+    def __init__(self, adaptor: Adaptor):
+        self.adaptor = adaptor
+
+    @staticmethod
+    def _get_key_signature(key: Key) -> tuple:
+        return (key.key_type, tuple([f.strip().lower() for f in key.fields]), key.primary_table.lower(),
+                tuple([f.strip().lower() for f in key.primary_fields]))
+
+    @staticmethod
+    def _get_pk_fields(table: Table) -> List[str]:
+        return [] if table.pk is None else [f.strip().lower() for f in table.pk.fields]
+
+    def diff_table(self, old_table: Table, new_table: Table) -> TableDiff:
+        diff = TableDiff(old_table, new_table)
+        for field in new_table.fields:
+            old_field = old_table.fields.find(field.name.raw().lower())
+            if old_field is None:
+                diff.added_fields.append(field)
+            elif self.adaptor.generate_field_definition(old_field) != self.adaptor.generate_field_definition(field):
+                diff.altered_fields.append((old_field, field))
+        diff.dropped_fields = [field for field in old_table.fields
+                               if new_table.fields.find(field.name.raw().lower()) is None]
+        diff.pk_changed = self._get_pk_fields(old_table) != self._get_pk_fields(new_table)
+
+        old_keys = {self._get_key_signature(key): key for key in old_table.keys}
+        new_keys = {self._get_key_signature(key): key for key in new_table.keys}
+        diff.added_keys = [key for signature, key in new_keys.items() if signature not in old_keys]
+        # the index a dialect builds to back a foreign key is left alone while the foreign key stays
+        foreign_key_fields = [signature[1] for signature in new_keys if signature[0] == KeyType.ForeignKey]
+        diff.dropped_keys = [key for signature, key in old_keys.items() if signature not in new_keys and
+                             not (signature[0] == KeyType.Index and signature[1] in foreign_key_fields)]
+        return diff
+
+    def diff(self, source: Database, target: Database) -> SchemaDiff:
+        diff = SchemaDiff(source, target)
+        source_tables = {table.name.raw().lower(): table for table in source.tables}
+        target_names = set([table.name.raw().lower() for table in target.tables])
+        for table in target.tables:
+            old_table = source_tables.get(table.name.raw().lower())
+            if old_table is None:
+                diff.added_tables.append(table)
+            else:
+                table_diff = self.diff_table(old_table, table)
+                if table_diff.has_changes():
+                    diff.altered_tables.append(table_diff)
+        diff.dropped_tables = [table for table in source.tables if table.name.raw().lower() not in target_names]
+        return diff
+
+    def generate_migration_scripts(self, source: Database, target: Database) -> List[str]:
+        return self.adaptor.generate_migration_scripts(self.diff(source, target))
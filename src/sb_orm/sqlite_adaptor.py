@@ -1,15 +1,21 @@
 import re
 import sqlite3
-from typing import Union, List
+from typing import Union, List, Any, Iterable, Sequence
 
+from sb_db_common import Session
 from sb_db_common.utils import get_fullname, get_filename, clean_string, find_in_list
 
-from .database_objects import Database, Table, KeyType, FieldType, Key, Field, DatatypeException, DataException
+from .database_objects import Database, Table, KeyType, FieldType, Key, Field, DatatypeException, DataException, \
+    TableDiff
 from .adaptor import Adaptor
 
 
 class SqliteAdaptor(Adaptor):
     """ Connection string is sqlite://filename or sqlite://memory """
+    __dialect__ = "sqlite"
+    __max_parameters__ = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    __supports_returning__ = sqlite3.sqlite_version_info >= (3, 35, 0)
+    __supports_drop_column__ = sqlite3.sqlite_version_info >= (3, 35, 0)
 
     def __init__(self, connection, naming):
         super().__init__(connection, naming)
@@ -19,31 +25,48 @@ class SqliteAdaptor(Adaptor):
         else:
             self.connection = get_fullname(connection_string)
 
+    def new_connection(self) -> Any:
+        return sqlite3.connect(self.connection)
+
     def import_schema(self, db_name: str) -> Database:
-        connection = sqlite3.connect(self.connection)
         if db_name is None:
             db_name = get_filename(self.connection)
 
         database = Database(self.naming.string_to_name(db_name))
 
-        cursor = connection.execute("SELECT sql FROM sqlite_master WHERE type='table'", [])
-        for row in cursor.fetchall():
-            create_script = row[0]
-            table = self.parse_create_script(create_script)
-            if table is not None:
-                database.tables.append(table)
+        with self.connect() as connection:
+            cursor = connection.execute("SELECT sql FROM sqlite_master WHERE type='table'", [])
+            for row in cursor.fetchall():
+                create_script = row[0]
+                table = self.parse_create_script(create_script)
+                if table is not None:
+                    database.tables.append(table)
 
-        cursor.close()
+            # indexes backing inline unique constraints have no sql and are already read with their table
+            cursor = connection.execute("SELECT sql FROM sqlite_master WHERE type='index' and sql is not null", [])
+            for row in cursor.fetchall():
+                self.parse_create_index_script(database, row[0])
+
+            cursor.close()
 
         return database
 
+    def get_schema_fingerprint(self, db_name: str) -> str | None:
+        # schema_version is bumped by sqlite on every schema change
+        with self.connect() as connection:
+            return str(self._fetch_rows(connection, "PRAGMA schema_version", {})[0][0])
+
     def escape_field_list(self, values: List[str]) -> List[str]:
         return ["\"" + value + "\"" for value in values]
 
-    def generate_create_script(self, table: Table) -> str:
-        sql: list[str] = []
-        for field in table.fields:
-            sql.append(f"\"{field.name.raw()}\" {self.get_field_type(field.type)} ")
+    def generate_field_definition(self, field: Field) -> str:
+        return f"\"{field.name.raw()}\" {self.get_field_type(field.type)}"
+
+    def generate_create_table_script(self, table: Table) -> str:
+        return self._generate_create_table_script(table, table.name.raw())
+
+    def _generate_create_table_script(self, table: Table, table_name: str) -> str:
+        sql: list[str] = [f"{self.generate_field_definition(field)} " for field in table.fields]
         if table.pk:
             sql.append(f"PRIMARY KEY ({','.join(self.escape_field_list(table.pk.fields))})")
 
@@ -52,18 +75,48 @@ class SqliteAdaptor(Adaptor):
                        f"\"{fk.primary_table}\"({','.join(self.escape_field_list(fk.primary_fields))})")
 
         joiner = ',\n\t'
-        result = f"create table \"{table.name.raw()}\" (\n\t{joiner.join(sql)}\n);\n"
-
-        for key in table.keys:
-            if key.key_type == KeyType.Unique:
-                result += f" CREATE UNIQUE INDEX \"{key.name.raw()}\" ON \"{table.name.raw()}\" " \
-                          f"({','.join(self.escape_field_list(key.fields))});\n"
-
-            elif key.key_type == KeyType.Index:
-                result += f" CREATE INDEX \"{key.name.raw()}\" ON \"{table.name.raw()}\" " \
-                          f"({','.join(self.escape_field_list(key.fields))});\n"
-
-        return result
+        return f"create table \"{table_name}\" (\n\t{joiner.join(sql)}\n);\n"
+
+    def generate_create_index_script(self, table: Table, key: Key) -> str:
+        unique = "UNIQUE " if key.key_type == KeyType.Unique else ""
+        return f" CREATE {unique}INDEX \"{key.name.raw()}\" ON \"{table.name.raw()}\" " \
+               f"({','.join(self.escape_field_list(key.fields))});\n"
+
+    def generate_drop_index_script(self, table: Table, key: Key) -> str:
+        return f"DROP INDEX \"{key.name.raw()}\";\n"
+
+    # foreign keys can only be declared with the table, so they change through generate_alter_table_scripts
+    def generate_add_foreign_key_scripts(self, table: Table, key: Key) -> List[str]:
+        return []
+
+    def generate_drop_foreign_key_scripts(self, table: Table, key: Key) -> List[str]:
+        return []
+
+    def generate_alter_table_scripts(self, diff: TableDiff) -> List[str]:
+        """ Added and, from 3.35, dropped columns alter the table in place. Anything else alter table cannot do
+            rebuilds it: the new table is created alongside, the kept columns copied across, the old table dropped
+            and the new one renamed. Run it with foreign_keys off, as the old table is dropped while referenced """
+        foreign_keys_changed = len([key for key in diff.added_keys + diff.dropped_keys
+                                    if key.key_type == KeyType.ForeignKey]) > 0
+        if len(diff.altered_fields) == 0 and not diff.pk_changed and not foreign_keys_changed and \
+                (len(diff.dropped_fields) == 0 or self.__supports_drop_column__):
+            table_name = diff.new_table.name.raw()
+            return [f"ALTER TABLE \"{table_name}\" ADD COLUMN {self.generate_field_definition(field)};\n"
+                    for field in diff.added_fields] + \
+                [f"ALTER TABLE \"{table_name}\" DROP COLUMN \"{field.name.raw()}\";\n" for field in diff.dropped_fields]
+
+        table_name = diff.new_table.name.raw()
+        new_name = f"{table_name}__new"
+        added = set([id(field) for field in diff.added_fields])
+        fields = self.escape_field_list([field.name.raw() for field in diff.new_table.fields if id(field) not in added])
+        # the rebuild drops every index with the old table, the added ones are created once the migration gets to them
+        indexes = [key for key in diff.new_table.keys
+                   if key.key_type in (KeyType.Unique, KeyType.Index) and key not in diff.added_keys]
+        return [self._generate_create_table_script(diff.new_table, new_name),
+                f"INSERT INTO \"{new_name}\" ({','.join(fields)}) SELECT {','.join(fields)} FROM \"{table_name}\";\n",
+                f"DROP TABLE \"{table_name}\";\n",
+                f"ALTER TABLE \"{new_name}\" RENAME TO \"{table_name}\";\n"] + \
+            [self.generate_create_index_script(diff.new_table, key) for key in indexes]
 
     def generate_table_exists_script(self, table: Table, db_name: str) -> str:
         return f"SELECT name FROM sqlite_schema WHERE type='table' and name = '{table.name.raw()}'"
@@ -81,8 +134,79 @@ class SqliteAdaptor(Adaptor):
         result = f"insert into {table.name.raw()} ({params}) values ({values});"
         return result
 
+    def generate_insert_many_script(self, table: Table, row_count: int) -> str:
+        fields = [f.name.raw() for f in table.fields if not f.auto_increment]
+        params = ", ".join([f"{f}" for f in fields])
+        values = ", ".join(["(" + ", ".join([f":{f}_{i}" for f in fields]) + ")" for i in range(row_count)])
+        return_id = ""
+        autoinc_fields = [f for f in table.fields if f.auto_increment]
+        if len(autoinc_fields) > 0 and self.__supports_returning__:
+            return_id = " returning " + ", ".join([f"{f.name.raw()}" for f in autoinc_fields])
+        result = f"insert into {table.name.raw()} ({params}) values {values}{return_id};"
+        return result
+
+    def execute_insert_many(self, session: Session, table: Table, params: List[dict]) -> List[Any]:
+        autoinc_fields = [f for f in table.fields if f.auto_increment]
+        if len(autoinc_fields) > 0 and not self.__supports_returning__:
+            # no returning clause before 3.35, so fall back to a row at a time to keep the generated ids
+            script = self.generate_insert_script(table)
+            return [session.execute_lastrowid(script, row) for row in params]
+
+        script = self.generate_insert_many_script(table, len(params))
+        values = self.get_insert_many_params(params)
+        if len(autoinc_fields) == 0:
+            session.execute(script, values)
+            return []
+
+        with session.fetch(script, values) as cursor:
+            ids = sorted([row[0] for row in cursor.fetchall()])
+        # returning rows come back in no set order. The rows are inserted in values order, each taking the rowid
+        # above the table's largest, so the sorted ids run consecutively in params order. Only a table whose
+        # largest rowid is already at the limit gets random ones, which cannot be matched up
+        if len(ids) > 0 and ids[-1] - ids[0] != len(ids) - 1:
+            raise DataException(f"Generated ids for {table.name.raw()} are not consecutive")
+        return ids
+
+    def bulk_load(self, session: Session, table: Table, rows: Iterable[Sequence], batch_size: int,
+                  commit: bool = False) -> int:
+        names = [f.name.raw() for f in table.fields if not f.auto_increment]
+        script = f"insert into {table.name.raw()} ({', '.join(names)}) values ({', '.join(['?'] * len(names))});"
+        connection = session.connection
+        cursor = connection.connection.cursor()
+        cache_size = cursor.execute("PRAGMA cache_size").fetchone()[0]
+        try:
+            cursor.execute("PRAGMA cache_size = -65536")
+            if not commit:
+                cursor.executemany(script, rows)
+                return cursor.rowcount
+
+            # synchronous can only be changed outside a transaction, so the session's open (and, as the caller
+            # committed, empty) one is ended for the load and started again after it
+            connection.commit()
+            synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+            cursor.execute("PRAGMA synchronous = OFF")
+            try:
+                connection.start()
+                cursor.executemany(script, rows)
+                count = cursor.rowcount
+                connection.commit()
+                return count
+            except Exception:
+                if connection.connection.in_transaction:
+                    connection.rollback()
+                raise
+            finally:
+                cursor.execute(f"PRAGMA synchronous = {synchronous}")
+                connection.start()
+        finally:
+            cursor.execute(f"PRAGMA cache_size = {cache_size}")
+            cursor.close()
+
     def generate_update_script(self, table: Table) -> str:
         fields = [f.name.raw() for f in table.fields if not f.auto_increment and f.name not in table.pk.fields]
+        return self.generate_partial_update_script(table, fields)
+
+    def generate_partial_update_script(self, table: Table, fields: List[str]) -> str:
         update_list = [f"{f} = :{f}" for f in fields]
         update = ", ".join(update_list)
         key_list = [f"{f} = :{f}" for f in table.pk.fields]
@@ -110,6 +234,30 @@ class SqliteAdaptor(Adaptor):
         result = f"select count(*) from {table.name.raw()} where {key};"
         return result
 
+    def generate_keyset_script(self, table: Table, fields: List[str], descending: bool, has_after: bool) -> str:
+        field_list = [f.name.raw() for f in table.fields]
+        select = ", ".join([f"{f}" for f in field_list])
+        where = ""
+        if has_after:
+            where = f" where ({', '.join(fields)}) {'<' if descending else '>'} " \
+                    f"({', '.join([f':after_{f}' for f in fields])})"
+        order = ", ".join([f"{f}{' desc' if descending else ''}" for f in fields])
+        result = f"select {select} from {table.name.raw()}{where} order by {order} limit :limit;"
+        return result
+
+    def generate_fetch_by_ids_script(self, table: Table, id_count: int) -> str:
+        field_list = [f.name.raw() for f in table.fields]
+        fields = ", ".join([f"{f}" for f in field_list])
+        if len(table.pk.fields) == 1:
+            pk = table.pk.fields[0]
+            key = f"{pk} in ({', '.join([f':{pk}_{i}' for i in range(id_count)])})"
+        else:
+            # row values compare against a VALUES list, a bare list of tuples needs a newer sqlite
+            rows = ", ".join(["(" + ", ".join([f":{f}_{i}" for f in table.pk.fields]) + ")" for i in range(id_count)])
+            key = f"({', '.join(table.pk.fields)}) in (values {rows})"
+        result = f"select {fields} from {table.name.raw()} where {key};"
+        return result
+
     def get_field_type(self, field_type: FieldType) -> str:
         if field_type == FieldType.Integer:
             return "INTEGER"
@@ -138,18 +286,56 @@ class SqliteAdaptor(Adaptor):
         else:
             raise DatatypeException("Unknown field type ")
 
+    def parse_create_index_script(self, database: Database, create_script: str) -> None:
+        match = re.search(r"CREATE (UNIQUE )?INDEX (?:IF NOT EXISTS )?(\w+) ON (\w+)\s*\((.*)\)",
+                          clean_string(create_script).replace("\"", ""), re.IGNORECASE)
+        if match:
+            table = database.get_table(match.group(3))
+            if table is not None:
+                table.keys.append(Key(self.naming.string_to_name(match.group(2)),
+                                      KeyType.Unique if match.group(1) else KeyType.Index,
+                                      [f.strip() for f in match.group(4).split(",")]))
+
+    @staticmethod
+    def split_create_script(create_script: str) -> List[str]:
+        """ One line for the header, each column and constraint, and the closing bracket. sqlite keeps the script
+            as written and appends added columns to the last column's line, so lines can't be relied on """
+        start = create_script.index("(")
+        end = create_script.rindex(")")
+        lines = [create_script[:start + 1]]
+        depth = 0
+        quoted = False
+        item_start = start + 1
+        for position in range(start + 1, end):
+            char = create_script[position]
+            if char == "'":
+                quoted = not quoted
+            elif quoted:
+                continue
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == "," and depth == 0:
+                lines.append(create_script[item_start:position])
+                item_start = position + 1
+        lines.append(create_script[item_start:end])
+        lines.append(")")
+        return [line for line in lines if line.strip() != ""]
+
     def parse_create_script(self, create_script: str) -> Union[Table, None]:
         table: Table
         # create_script = create_script.replace(",")
-        lines = create_script.split("\n")
+        lines = self.split_create_script(create_script)
         ux_count = 1
         ix_count = 1
+        fk_count = 1
         table_name = ""
 
         for line in lines:
-            line = clean_string(line)
-            if "CREATE TABLE" in line:
-                match = re.search(r"CREATE TABLE (\w+)\s*\(", line)
+            line = clean_string(line).replace("\"", "")
+            if "CREATE TABLE" in line.upper():
+                match = re.search(r"CREATE TABLE (\w+)\s*\(", line, re.IGNORECASE)
                 if match:
                     table_name = match.group(1)
                     if table_name == "sqlite_sequence":
@@ -188,6 +374,16 @@ class SqliteAdaptor(Adaptor):
                     table.keys.append(ux)
                 else:
                     raise DataException("ux issue")
+            elif line.startswith("FOREIGN KEY"):
+                match = re.search(r"FOREIGN KEY \(([^\)]+)\) REFERENCES (\w+)\W*\(([^\)]+)\)", line)
+                if match:
+                    ref = Key(self.naming.string_to_name(f"fk_{table_name}_{fk_count}"), KeyType.ForeignKey,
+                              match.group(1).split(","), match.group(2), match.group(3).split(","))
+                    fk_count = fk_count + 1
+                    ref.referenced_table = table.name.raw()
+                    table.keys.append(ref)
+                else:
+                    raise DataException("fk issue")
             elif line.startswith("CONSTRAINT"):
                 match = re.search(r"CONSTRAINT (\w+) (PRIMARY KEY|FOREIGN KEY)(.*)", line)
                 if match:
@@ -224,7 +420,11 @@ class SqliteAdaptor(Adaptor):
                 line = clean_string(line).lower()
                 words = line.split()
                 name = words[0]
-                type = words[1]
+                # declared sizes, as in varchar(20) or decimal(10, 2), are kept though sqlite ignores them
+                match = re.match(r"\w+\s+(\w+)\s*(?:\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?", line)
+                type = match.group(1)
+                size = int(match.group(2)) if match.group(2) else 0
+                scale = int(match.group(3)) if match.group(3) else 0
                 required = False
                 auto_increment = False
                 default_value = None
@@ -259,8 +459,8 @@ class SqliteAdaptor(Adaptor):
                     index = find_in_list("default", words)
                     default_value = words[index + 1]
 
-                field = Field(self.naming.string_to_name(name), FieldType.get_fieldtype(type), required=required,
-                              auto_increment=auto_increment, default=default_value)
+                field = Field(self.naming.string_to_name(name), FieldType.get_fieldtype(type), size, scale,
+                              required=required, auto_increment=auto_increment, default=default_value)
                 table.fields.append(field)
 
         if table.pk is not None and len(table.pk.fields) == 1:
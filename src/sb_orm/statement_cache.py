@@ -0,0 +1,135 @@
+import re
+import threading
+
+from sb_db_common import Session, DataException
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.adaptor_factory import AdaptorFactory
+from src.sb_orm.database_objects import Table
+from src.sb_orm.query_registry import QueryRegistry
+
+
+class NoNaming(object):
+    """ Stands in for the Naming of the cache's adaptors. Generating scripts takes no naming, so anything reaching
+        for one (importing a schema, say) is a misuse and fails here rather than on None """
+
+    def __getattr__(self, name: str):
+        raise DataException(f"Statement cache adaptors only generate scripts, they have no naming ({name})")
+
+
+class TableStatements(object):
+    """ The generated scripts for one table in one dialect. table_exists keeps a {database} placeholder.
+        names maps each script back to its statement name for instrumentation """
+    table_exists: str
+    count: str
+    create: str
+    insert: str
+    update: str
+    delete: str
+    drop: str
+    fetch_by_id: str
+    item_exists: str
+
+    def __init__(self, table: Table, adaptor: Adaptor):
+        self.table = table
+        self.adaptor = adaptor
+        self.partial_updates: dict[tuple[str, ...], str] = {}
+        self.keysets: dict[tuple[tuple[str, ...], bool, bool], str] = {}
+        self._queries: QueryRegistry | None = None
+        self.names: dict[str, str] = {}
+        self.table_exists = adaptor.generate_table_exists_script(table, "{database}")
+        self.count = adaptor.generate_count_script(table)
+        self.create = adaptor.generate_create_script(table)
+        self.insert = adaptor.generate_insert_script(table)
+        self.update = adaptor.generate_update_script(table)
+        self.delete = adaptor.generate_delete_script(table)
+        self.drop = adaptor.generate_drop_script(table)
+        self.fetch_by_id = adaptor.generate_fetch_by_id_script(table)
+        self.item_exists = adaptor.generate_item_exists_script(table)
+        for name in ["table_exists", "count", "create", "insert", "update", "delete", "drop", "fetch_by_id",
+                     "item_exists"]:
+            self.names.setdefault(getattr(self, name), name)
+
+    def get_name(self, script: str) -> str | None:
+        return self.names.get(script)
+
+    @property
+    def queries(self) -> QueryRegistry:
+        """ The table's custom queries, compiled for this dialect on first use """
+        if self._queries is None:
+            queries = QueryRegistry(self.table, self.adaptor)
+            for query in queries.queries.values():
+                self.names.setdefault(query.script, f"query:{query.name}")
+            self._queries = queries
+        return self._queries
+
+    def get_keyset(self, fields: tuple[str, ...], descending: bool, has_after: bool) -> str:
+        key = (fields, descending, has_after)
+        script = self.keysets.get(key)
+        if script is None:
+            script = self.keysets.setdefault(key, self.adaptor.generate_keyset_script(self.table, list(fields),
+                                                                                      descending, has_after))
+            self.names.setdefault(script, f"keyset:{','.join(fields)}:{'desc' if descending else 'asc'}"
+                                          f"{':after' if has_after else ''}")
+        return script
+
+    def get_partial_update(self, fields: list[str]) -> str:
+        """ Update script for just the given columns, cached per column set """
+        order = [f.name.raw() for f in self.table.fields]
+        key = tuple(sorted(fields, key=lambda f: order.index(f) if f in order else len(order)))
+        script = self.partial_updates.get(key)
+        if script is None:
+            script = self.partial_updates.setdefault(key,
+                                                     self.adaptor.generate_partial_update_script(self.table, list(key)))
+            self.names.setdefault(script, f"update:{','.join(key)}")
+        return script
+
+
+class StatementCache(object):
+    """ Process wide cache of generated scripts keyed by (table definition, adaptor dialect).
+        Entries are built once on first use and never change, so lookups need no locking. """
+    __adaptors__: dict[str, Adaptor] = {}
+    __connection_adaptors__: dict[str, Adaptor] = {}
+    __statements__: dict[tuple[Table, str], TableStatements] = {}
+    __lock__ = threading.Lock()
+
+    @classmethod
+    def get_adaptor(cls, dialect: str) -> Adaptor:
+        adaptor = cls.__adaptors__.get(dialect)
+        if adaptor is None:
+            with cls.__lock__:
+                adaptor = cls.__adaptors__.get(dialect)
+                if adaptor is None:
+                    adaptor = AdaptorFactory.get_adaptor_for_dbtype(dialect, NoNaming())
+                    if adaptor is None:
+                        raise DataException(f"No adaptor for {dialect}")
+                    cls.__adaptors__[dialect] = adaptor
+        return adaptor
+
+    @classmethod
+    def get_adaptor_for_session(cls, session: Session) -> Adaptor:
+        connection_string = session.connection.connection_string
+        adaptor = cls.__connection_adaptors__.get(connection_string)
+        if adaptor is None:
+            # the connection's provider name is not reliably set, the connection string always carries the type
+            match = re.search(r"(\w+):\/\/", connection_string)
+            if match is None:
+                raise DataException("invalid connection string")
+            adaptor = cls.get_adaptor(match.group(1))
+            cls.__connection_adaptors__[connection_string] = adaptor
+        return adaptor
+
+    @classmethod
+    def get_statements(cls, table: Table, adaptor: Adaptor) -> TableStatements:
+        key = (table, adaptor.__dialect__)
+        statements = cls.__statements__.get(key)
+        if statements is None:
+            statements = TableStatements(table, adaptor)
+            with cls.__lock__:
+                statements = cls.__statements__.setdefault(key, statements)
+        return statements
+
+    @classmethod
+    def clear(cls):
+        with cls.__lock__:
+            cls.__statements__.clear()
@@ -1,17 +1,20 @@
+import copy
 from typing import TypeVar
 
 from src.sb_orm.adaptor import Adaptor
 from src.sb_orm.database_objects import Table
+from src.sb_orm.statement_cache import StatementCache
 
 
 class Mappable:
-    pass
+    __slots__ = ()
 
 
 M = TypeVar("M", bound=Mappable)
 
 
 class TableBase(Mappable):
+    __slots__ = ()
     __table_name__ = "table_name"
     __table_definition__: Table = None
     __table_exists_script__ = "table_exists"
@@ -26,20 +29,40 @@ class TableBase(Mappable):
 
     @classmethod
     def build_queries(cls, adaptor: Adaptor, db_name: str):
+        """ Copies the cached scripts for this adaptor onto the class. Repositories look statements up per session
+            through StatementCache, so this is only needed by code that reads the class attributes directly """
+        statements = StatementCache.get_statements(cls.__table_definition__, adaptor)
         cls.__table_name__ = cls.__table_definition__.name.raw()
-        cls.__table_exists_script__ = adaptor.generate_table_exists_script(cls.__table_definition__, db_name)
-        cls.__table_count_script__ = adaptor.generate_count_script(cls.__table_definition__)
-        cls.__create_script__ = adaptor.generate_create_script(cls.__table_definition__)
-        cls.__insert_script__ = adaptor.generate_insert_script(cls.__table_definition__)
-        cls.__update_script__ = adaptor.generate_update_script(cls.__table_definition__)
-        cls.__delete_script__ = adaptor.generate_delete_script(cls.__table_definition__)
-        cls.__drop_script__ = adaptor.generate_drop_script(cls.__table_definition__)
-        cls.__fetch_by_id_script__ = adaptor.generate_fetch_by_id_script(cls.__table_definition__)
-        cls.__item_exists_script__ = adaptor.generate_item_exists_script(cls.__table_definition__)
+        cls.__table_exists_script__ = statements.table_exists.format(database=db_name)
+        cls.__table_count_script__ = statements.count
+        cls.__create_script__ = statements.create
+        cls.__insert_script__ = statements.insert
+        cls.__update_script__ = statements.update
+        cls.__delete_script__ = statements.delete
+        cls.__drop_script__ = statements.drop
+        cls.__fetch_by_id_script__ = statements.fetch_by_id
+        cls.__item_exists_script__ = statements.item_exists
 
     def map_row(self, row) -> M:
         pass
 
+    def mark_loaded(self, state) -> None:
+        """ Records the state the row was loaded or last saved with. state is either the mapped row or the
+            update params at the time of saving """
+        self._loaded_state = state
+
+    def get_changed_fields(self) -> list[str] | None:
+        """ Names of the update params that differ from the loaded state, or None if the state is unknown """
+        state = getattr(self, "_loaded_state", None)
+        if state is None:
+            return None
+        if not isinstance(state, dict):
+            # the row is mapped onto a copy, entities need not have a constructor without arguments
+            state = copy.copy(self).map_row(state).get_update_params()
+            self._loaded_state = state
+        return [name for name, value in self.get_update_params().items()
+                if name not in state or state[name] != value]
+
     def get_update_params(self) -> dict:
         return {}
 
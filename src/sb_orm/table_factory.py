@@ -0,0 +1,79 @@
+from typing import Any
+
+from src.sb_orm.database_objects import Table, FieldType, DataException
+from src.sb_orm.table_base import TableBase
+
+
+class TableFactory(object):
+    """ Generates map_row, get_insert_params and get_update_params from a table definition.
+        The methods are compiled once per class, so mapping a row is a single tuple unpack. """
+
+    __field_defaults__ = {FieldType.Integer: 0,
+                          FieldType.String: "",
+                          FieldType.Float: 0.0,
+                          FieldType.Boolean: False}
+
+    @staticmethod
+    def _get_attribute_names(table: Table) -> list[str]:
+        names = [f.name.raw() for f in table.fields]
+        for name in names:
+            if not name.isidentifier():
+                raise DataException(f"Field {name} cannot be used as an attribute name")
+        return names
+
+    @classmethod
+    def _generate_source(cls, table: Table) -> str:
+        names = cls._get_attribute_names(table)
+        insert_names = [f.name.raw() for f in table.fields if not f.auto_increment]
+        pk_fields = table.pk.fields if table.pk else []
+        update_names = [f.name.raw() for f in table.fields if not f.auto_increment or f.name.raw() in pk_fields]
+
+        targets = ", ".join([f"self.{n}" for n in names])
+        insert_params = ", ".join([f"\"{n}\": self.{n}" for n in insert_names])
+        update_params = ", ".join([f"\"{n}\": self.{n}" for n in update_names])
+        init_args = ", ".join(["self"] + [f"{n}=__defaults__[{i}]" for i, n in enumerate(names)])
+        init_body = "".join([f"    self.{n} = {n}\n" for n in names]) or "    pass\n"
+
+        return (f"def __init__({init_args}):\n{init_body}\n"
+                f"def map_row(self, row):\n"
+                f"    {targets}{',' if len(names) == 1 else ''} = row\n"
+                f"    return self\n\n"
+                f"def get_insert_params(self):\n"
+                f"    return {{{insert_params}}}\n\n"
+                f"def get_update_params(self):\n"
+                f"    return {{{update_params}}}\n")
+
+    @classmethod
+    def _compile(cls, table: Table) -> dict[str, Any]:
+        namespace = {"__defaults__": tuple([cls.__field_defaults__.get(f.type) for f in table.fields])}
+        exec(compile(cls._generate_source(table), f"<sb_orm {table.name.raw()}>", "exec"), namespace)
+        return namespace
+
+    @classmethod
+    def compile_mappers(cls, table_class: type) -> type:
+        """ Replaces the mapping methods of an existing TableBase subclass with compiled ones """
+        if table_class.__dict__.get("__mappers_compiled__", False):
+            return table_class
+
+        namespace = cls._compile(table_class.__table_definition__)
+        table_class.map_row = namespace["map_row"]
+        table_class.get_insert_params = namespace["get_insert_params"]
+        table_class.get_update_params = namespace["get_update_params"]
+        table_class.__mappers_compiled__ = True
+        return table_class
+
+    @classmethod
+    def create_table_class(cls, table: Table, class_name: str | None = None) -> type:
+        """ Builds a slotted TableBase subclass for the table definition """
+        namespace = cls._compile(table)
+        attributes = {"__slots__": tuple(cls._get_attribute_names(table) + ["_loaded_state"]),
+                      "__table_definition__": table,
+                      "__table_name__": table.name.raw(),
+                      "__mappers_compiled__": True,
+                      "__init__": namespace["__init__"],
+                      "map_row": namespace["map_row"],
+                      "get_insert_params": namespace["get_insert_params"],
+                      "get_update_params": namespace["get_update_params"]}
+        if class_name is None:
+            class_name = table.name.pascal() if len(table.name.words) > 0 else table.name.raw()
+        return type(class_name, (TableBase,), attributes)
@@ -0,0 +1,113 @@
+from typing import Iterable
+
+from sb_db_common import Session
+
+from src.sb_orm.adaptor import Adaptor
+from src.sb_orm.database_objects import Database, Table
+from src.sb_orm.repository_base import RepositoryBase
+from src.sb_orm.table_base import TableBase
+
+
+class UnitOfWork(object):
+    """ Collects new, dirty and deleted entities for a session and writes them in batches on flush.
+        Inserts run in foreign key order, then updates, then deletes in reverse order. Entities are written
+        through the repository registered for their class, or a plain RepositoryBase if there is none, so
+        repository caches are invalidated as usual. """
+
+    def __init__(self, session: Session, repositories: Iterable[RepositoryBase] = (), batch_size: int = 500):
+        self.session = session
+        self.batch_size = batch_size
+        self.repositories: dict[type, RepositoryBase] = {repository.__table__: repository
+                                                         for repository in repositories}
+        # keyed on id() so entities need not be hashable, insertion order is kept within each table
+        self.new: dict[int, TableBase] = {}
+        self.dirty: dict[int, TableBase] = {}
+        self.deleted: dict[int, TableBase] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def register_new(self, item: TableBase) -> None:
+        self.deleted.pop(id(item), None)
+        self.new[id(item)] = item
+
+    def register_dirty(self, item: TableBase) -> None:
+        if id(item) not in self.new and id(item) not in self.deleted:
+            self.dirty[id(item)] = item
+
+    def register_deleted(self, item: TableBase) -> None:
+        if self.new.pop(id(item), None) is not None:
+            # never written, so there is nothing to delete
+            return
+        self.dirty.pop(id(item), None)
+        self.deleted[id(item)] = item
+
+    def _get_repository(self, table: type) -> RepositoryBase:
+        repository = self.repositories.get(table)
+        if repository is None:
+            repository = type(f"{table.__name__}Repository", (RepositoryBase,), {"__table__": table})()
+            self.repositories[table] = repository
+        return repository
+
+    @staticmethod
+    def _group(items: Iterable[TableBase]) -> dict[type, list[TableBase]]:
+        groups: dict[type, list[TableBase]] = {}
+        for item in items:
+            groups.setdefault(type(item), []).append(item)
+        return groups
+
+    @staticmethod
+    def _order(tables: Iterable[type]) -> list[type]:
+        # several classes may map the same table definition, each of them is written
+        classes: dict[Table, list[type]] = {}
+        for table in tables:
+            classes.setdefault(table.__table_definition__, []).append(table)
+        database = Database()
+        database.tables = list(classes.keys())
+        return [table_class for table in Adaptor.get_ordered_table_list(database) for table_class in classes[table]]
+
+    def flush(self) -> None:
+        inserts = self._group(self.new.values())
+        updates = self._group(self.dirty.values())
+        deletes = self._group(self.deleted.values())
+
+        for table in self._order(inserts.keys()):
+            self._get_repository(table).add_many(self.session, inserts[table], self.batch_size)
+
+        for table, items in updates.items():
+            self._get_repository(table).update_many(self.session, items, self.batch_size)
+
+        for table in reversed(self._order(deletes.keys())):
+            repository = self._get_repository(table)
+            repository.delete_many(self.session, [repository._get_pk(item) for item in deletes[table]],
+                                   self.batch_size)
+
+        self.clear()
+
+    def commit(self) -> None:
+        self.flush()
+        self.session.commit()
+        self._end_transaction()
+
+    def rollback(self) -> None:
+        self.clear()
+        self.session.rollback()
+        self._end_transaction()
+
+    def _end_transaction(self) -> None:
+        # the entity caches may take the rows written in the transaction again
+        caches = set([repository.__entity_cache__ for repository in self.repositories.values()])
+        for cache in caches:
+            if cache is not None:
+                cache.end_transaction(self.session)
+
+    def clear(self) -> None:
+        self.new.clear()
+        self.dirty.clear()
+        self.deleted.clear()